@@ -1,39 +1,42 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import cv2
 import numpy as np
-from tkinter import Tk, filedialog, Button, Label
+
+# Todo o processamento (filtros, adesivos, sessão de edição) fica no núcleo, sem interface;
+# este arquivo é só a interface em volta dele.
+from editor_nucleo import (
+    ALTURA_FAIXA_DISCO, NUM_TRABALHADORES, PASTA_LUTS, QUALIDADE_WEBCAM,
+    CenaDeAdesivos, ImagemCanalUnico, PoolDeQuadros, SessaoEditor,
+    carregar_adesivos, compilar_adesivo, compor_adesivo, expandir_para_bgr, filtros_registrados,
+    montar_cadeia, nomes_filtros, processar_em_faixas, redimensionar_compacta, registrar_luts,
+)
 
 # ---------------------------------------
 # Configurações iniciais e variáveis globais
 # ---------------------------------------
 
-# Carregar adesivos com transparência, cada adesivo é lido com canal alfa (IMREAD_UNCHANGED).
-adesivos = {
-    'oculos': cv2.imread('eyeglasses.png', cv2.IMREAD_UNCHANGED),
-    'chapeu': cv2.imread('hat.png', cv2.IMREAD_UNCHANGED),
-    'estrela': cv2.imread('star.png', cv2.IMREAD_UNCHANGED),
-    'arvore': cv2.imread('arvore.png', cv2.IMREAD_UNCHANGED),
-    'alce': cv2.imread('alce.png', cv2.IMREAD_UNCHANGED),
-    'nascimento': cv2.imread('nascimento.png', cv2.IMREAD_UNCHANGED),
-}
-
-# Verifica se os adesivos foram carregados corretamente.
-for nome, adesivo in adesivos.items():
-    if adesivo is None:  # Se algum adesivo não foi carregado.
-        print(f"Erro ao carregar o adesivo: {nome}")  # Imprime mensagem de erro.
-        exit(1)  # Encerra o programa.
-
 # Declaração de variáveis globais utilizadas em todo o programa.
+adesivos = {}             # Imagens BGRA dos adesivos, carregadas ao iniciar a interface.
+adesivos_compilados = []  # Os mesmos adesivos, compilados para serem colados.
 indice_adesivo_atual = 0  # Indica qual adesivo está selecionado no momento.
-indice_filtro_atual = 0   # Indica qual filtro está selecionado no momento.
-historico_acao = []       # Lista para armazenar o histórico de ações (para desfazer alterações).
-imagem_original = None    # Armazena a imagem original carregada pelo usuário.
-imagem_com_efeitos = None # Armazena a imagem com filtros ou adesivos aplicados.
-escala_visualizacao = None  # Armazena a escala da imagem para exibição na interface.
+sessao = None             # Sessão de edição (SessaoEditor) da imagem carregada, no modo imagem.
+imagem_com_efeitos = None # Imagem exibida no quadro de edição (a imagem editada da sessão, ou o frame da webcam).
+EDICAO_EM_PROXY = True    # Edita uma cópia do tamanho da tela e só processa a resolução cheia ao salvar.
 miniaturas = []           # Lista de miniaturas de filtros, para exibição na interface.
+miniaturas_adesivos = []  # Miniaturas 80x80 dos adesivos, calculadas uma única vez.
+cena_webcam = None        # Adesivos colocados no modo webcam (CenaDeAdesivos), colados em cada frame.
 usando_webcam = False     # Indica se o programa está no modo de uso de webcam.
 video_writer = None       # Objeto para gravar vídeos com frames processados.
 video_filename = None     # Nome do arquivo de vídeo que será salvo.
 gravando_video = False    # Indica se o programa está gravando um vídeo no momento.
+janela_suja = False       # Indica que a janela precisa ser redesenhada no próximo ciclo do laço da interface.
+pool_quadros = PoolDeQuadros()  # Buffers do laço de exibição (thread da interface).
 
 # Definição de dimensões para a janela e elementos visuais.
 LARGURA_JANELA = 1366
@@ -43,173 +46,329 @@ ALTURA_FRAME = 432
 ALTURA_ADESIVOS = 100
 ALTURA_BARRA = 100
 ALTURA_BOTOES = 50
-
-# Lista com os nomes dos filtros disponíveis.
-nomes_filtros = [
-    "Original",             # Filtro 0: Sem alterações na imagem.
-    "Escala de Cinza",      # Filtro 1: Converte a imagem para preto e branco.
-    "Inversão",             # Filtro 2: Inverte as cores da imagem.
-    "Desfoque",             # Filtro 3: Aplica um desfoque na imagem.
-    "Efeito Tumblr",        # Filtro 4: Aplica um efeito de tonalidade rosa.
-    "Efeito Prism",         # Filtro 5: Aplica um efeito de arco-íris.
-    "Vintage",              # Filtro 6: Aplica uma tonalidade sépia para um estilo retrô.
-    "Silly Face",           # Filtro 7: Aumenta o brilho da imagem.
-    "Kyle+Kendall Slim",    # Filtro 8: Aplica suavização à imagem.
-    "Filtro Kodak",         # Filtro 9: Simula cores mais quentes, estilo filme Kodak.
-    "Efeito Preto e Vermelho"  # Filtro 10: Cria um efeito preto e vermelho.
-]
+LARGURA_BOTAO = 200
+ESPACO_BOTOES = 20        # Distância de cada botão ao centro da janela.
+ZOOM_MAXIMO = 16.0        # Maior ampliação do quadro de edição, em relação à imagem inteira visível.
+PASSO_ZOOM = 1.25         # Ampliação a cada passo da roda do mouse.
+# A partir dessa ampliação da imagem exibida (a proxy), o quadro passa a vir da edição em resolução cheia.
+# A folga evita que arredondamentos do tamanho da proxy (escala um pouco acima de 1 sem zoom) peçam a resolução cheia.
+ESCALA_MINIMA_DETALHE = 1.5
+INTERVALO_QUADRO_MS = 16  # Intervalo entre redesenhos da janela no modo imagem (~60 por segundo).
+FREQUENCIA_MINIATURAS_WEBCAM = 2.0  # Atualizações por segundo das miniaturas no modo webcam.
+
+# Filtros selecionados (índices do registro), que também definem os contornos da barra de filtros:
+# um só filtro, ou a pilha montada com Shift. E a cadeia já montada a partir deles.
+indices_cadeia = [0]
+cadeia_atual = montar_cadeia(indices_cadeia)
 
 # ---------------------------------------
 # Funções auxiliares
 # ---------------------------------------
 
-def redimensionar_para_visualizacao(imagem):
+class LayoutDaJanela:
     """
-    Redimensiona a imagem para caber no quadro de edição, mantendo a proporção.
+    Geometria da janela do editor para uma imagem de altura x largura pixels: a escala e o retângulo
+    do quadro de edição e a posição das faixas abaixo dele. Tudo é calculado com aritmética, sem
+    tocar na imagem, e o mesmo objeto é usado para desenhar a janela e para saber onde o mouse clicou.
     """
-    global escala_visualizacao
-    if imagem is None:  # Caso a imagem seja None, retorna None.
+    def __init__(self, altura_imagem, largura_imagem, largura_janela=LARGURA_JANELA):
+        self.largura_janela = largura_janela
+        # Maior escala com a qual a imagem cabe no quadro de edição, mantendo a proporção.
+        self.escala = min(LARGURA_FRAME / largura_imagem, ALTURA_FRAME / altura_imagem)
+        self.largura_quadro = int(largura_imagem * self.escala)
+        self.altura_quadro = int(altura_imagem * self.escala)
+        # O quadro fica centralizado na horizontal, abaixo da área dos adesivos.
+        self.x_quadro = (largura_janela - self.largura_quadro) // 2
+        self.y_quadro = ALTURA_ADESIVOS
+        # A barra de filtros e os botões ficam logo abaixo do quadro.
+        self.y_barra = self.y_quadro + self.altura_quadro
+        self.y_botoes = self.y_barra + ALTURA_BARRA
+        self.largura_miniatura = largura_janela // len(nomes_filtros)
+        self.x_salvar = (largura_janela // 2) - LARGURA_BOTAO - ESPACO_BOTOES
+        self.x_desfazer = (largura_janela // 2) + ESPACO_BOTOES
+
+    def regiao(self, x, y):
+        """
+        Diz o que está no ponto (x, y) da janela: ("adesivo", índice), ("quadro", x, y) relativo ao canto
+        do quadro, ("filtro", índice), ("salvar",), ("desfazer",) ou None quando não há nada ali.
+        """
+        # As faixas são intervalos semiabertos: cada linha da janela pertence a uma única faixa.
+        if 0 <= y < ALTURA_ADESIVOS:
+            indice = x // 90
+            return ("adesivo", indice) if 0 <= indice < len(adesivos_compilados) else None
+        if self.y_quadro <= y < self.y_barra:
+            if self.x_quadro <= x < self.x_quadro + self.largura_quadro:
+                return ("quadro", x - self.x_quadro, y - self.y_quadro)
+            return None  # Faixa preta ao lado do quadro.
+        if self.y_barra <= y < self.y_botoes:
+            indice = x // self.largura_miniatura
+            return ("filtro", indice) if 0 <= indice < len(nomes_filtros) else None
+        if self.y_botoes <= y < self.y_botoes + ALTURA_BOTOES:
+            if self.x_salvar <= x <= self.x_salvar + LARGURA_BOTAO:
+                return ("salvar",)
+            if self.x_desfazer <= x <= self.x_desfazer + LARGURA_BOTAO:
+                return ("desfazer",)
         return None
-    altura, largura = imagem.shape[:2]  # Obtém as dimensões da imagem (altura, largura).
-    # Calcula a escala máxima para que a imagem caiba dentro das dimensões do frame.
-    escala_visualizacao = min(LARGURA_FRAME / largura, ALTURA_FRAME / altura)
-    nova_largura = int(largura * escala_visualizacao)  # Calcula a nova largura.
-    nova_altura = int(altura * escala_visualizacao)    # Calcula a nova altura.
-    # Redimensiona a imagem para as novas dimensões.
-    return cv2.resize(imagem, (nova_largura, nova_altura))
-
-def aplicar_adesivo(imagem_fundo, adesivo, x, y):
-    """
-    Aplica um adesivo na posição especificada (x, y) da imagem.
-    Suporta adesivos com canal alfa para transparência.
-    """
-    altura_adesivo, largura_adesivo = adesivo.shape[:2]  # Obtém as dimensões do adesivo.
-
-    if adesivo.shape[2] == 4:  # Verifica se o adesivo possui canal alfa.
-        azul, verde, vermelho, alfa = cv2.split(adesivo)  # Separa os canais RGBA.
-        adesivo_rgb = cv2.merge((azul, verde, vermelho))  # Junta os canais RGB.
-        mascara = alfa  # Define a máscara como o canal alfa.
-    else:  # Caso o adesivo não tenha canal alfa.
-        adesivo_rgb = adesivo  # Usa o adesivo sem alterações.
-        # Cria uma máscara branca do tamanho do adesivo.
-        mascara = np.ones((altura_adesivo, largura_adesivo), dtype=np.uint8) * 255
-
-    # Verifica se o adesivo está dentro dos limites da imagem.
-    if y + altura_adesivo > imagem_fundo.shape[0] or x + largura_adesivo > imagem_fundo.shape[1]:
-        return  # Não aplica o adesivo se estiver fora dos limites.
-
-    # Seleciona a região na imagem onde o adesivo será aplicado.
-    roi = imagem_fundo[y:y + altura_adesivo, x:x + largura_adesivo]
-    # Remove a área onde o adesivo será aplicado usando a máscara invertida.
-    fundo = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(mascara))
-    # Combina a área limpa com o adesivo usando a máscara.
-    sobreposicao = cv2.add(fundo, adesivo_rgb)
-    # Insere o adesivo na imagem.
-    imagem_fundo[y:y + altura_adesivo, x:x + largura_adesivo] = sobreposicao
-
-def aplicar_adesivo_webcam(imagem_fundo, adesivo, x, y):
-    """
-    Aplica um adesivo na imagem de fundo usada na webcam e mantém os adesivos persistentes.
-    """
-    global imagem_com_adesivos
-    altura_adesivo, largura_adesivo = adesivo.shape[:2]  # Obtém as dimensões do adesivo.
-
-    if adesivo.shape[2] == 4:  # Verifica se o adesivo possui canal alfa.
-        azul, verde, vermelho, alfa = cv2.split(adesivo)  # Separa os canais RGBA.
-        adesivo_rgb = cv2.merge((azul, verde, vermelho))  # Junta os canais RGB.
-        mascara = alfa  # Define a máscara como o canal alfa.
-    else:  # Caso o adesivo não tenha canal alfa.
-        adesivo_rgb = adesivo  # Usa o adesivo sem alterações.
-        # Cria uma máscara branca do tamanho do adesivo.
-        mascara = np.ones((altura_adesivo, largura_adesivo), dtype=np.uint8) * 255
-
-    # Verifica se o adesivo está dentro dos limites da imagem.
-    if y + altura_adesivo > imagem_fundo.shape[0] or x + largura_adesivo > imagem_fundo.shape[1]:
-        return  # Não aplica o adesivo se estiver fora dos limites.
-
-    # Seleciona a região na camada de adesivos onde o adesivo será aplicado.
-    roi = imagem_com_adesivos[y:y + altura_adesivo, x:x + largura_adesivo]
-    # Remove a área onde o adesivo será aplicado usando a máscara invertida.
-    fundo = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(mascara))
-    # Combina a área limpa (fundo sem adesivo) com o adesivo usando a máscara.
-    # A função cv2.add realiza a soma pixel a pixel do fundo e do adesivo RGB.
-    sobreposicao = cv2.add(fundo, adesivo_rgb)
-
-    # Atualiza a camada de adesivos, substituindo a área correspondente pelo adesivo já combinado.
-    # Isso garante que o adesivo permaneça fixo na imagem, mesmo que o frame mude.
-    imagem_com_adesivos[y:y + altura_adesivo, x:x + largura_adesivo] = sobreposicao
-
-def aplicar_filtro_generico(imagem_base, indice_filtro):
-    """
-    Aplica um dos filtros predefinidos na imagem base fornecida.
-    """
-    # Verifica se a imagem base é válida (não é None). Se não for, retorna None.
-    if imagem_base is None:
+
+@lru_cache(maxsize=16)
+def layout_da_janela(altura_imagem, largura_imagem):
+    """
+    Layout da janela para uma imagem do tamanho dado, calculado uma vez por tamanho.
+    """
+    return LayoutDaJanela(altura_imagem, largura_imagem)
+
+class VisaoDoQuadro:
+    """
+    Zoom e posição da parte da imagem mostrada no quadro de edição. Com zoom 1 a imagem inteira
+    aparece (como antes); ampliando, o quadro mostra só uma região, que pode ser deslocada.
+    Converte pontos do quadro para a imagem, para os adesivos caírem onde o usuário clicou.
+    As posições são em pixels da imagem exibida (a proxy, no modo imagem).
+    """
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.zoom = 1.0
+        self.x0, self.y0 = 0.0, 0.0  # Canto superior esquerdo da região visível, em pixels da imagem.
+
+    def escala(self, layout):
+        """
+        Pixels do quadro por pixel da imagem.
+        """
+        return layout.escala * self.zoom
+
+    def ajustar(self, layout, altura, largura):
+        """
+        Mantém a região visível dentro de uma imagem altura x largura.
+        """
+        escala = self.escala(layout)
+        self.x0 = min(max(0.0, self.x0), max(0.0, largura - layout.largura_quadro / escala))
+        self.y0 = min(max(0.0, self.y0), max(0.0, altura - layout.altura_quadro / escala))
+
+    def para_imagem(self, layout, x, y):
+        """
+        Converte um ponto do quadro (relativo ao seu canto) para a posição correspondente na imagem,
+        sem arredondar: com zoom, a fração diz em que pixel da imagem original o clique caiu.
+        """
+        escala = self.escala(layout)
+        # O centro do pixel do quadro é que cai dentro de um pixel da imagem.
+        return self.x0 + (x + 0.5) / escala, self.y0 + (y + 0.5) / escala
+
+    def ampliar(self, layout, altura, largura, x, y, fator):
+        """
+        Multiplica o zoom por 'fator', mantendo parado o ponto da imagem que está sob (x, y) no quadro.
+        """
+        escala = self.escala(layout)
+        x_imagem, y_imagem = self.x0 + x / escala, self.y0 + y / escala
+        self.zoom = min(max(1.0, self.zoom * fator), ZOOM_MAXIMO)
+        escala = self.escala(layout)
+        self.x0, self.y0 = x_imagem - x / escala, y_imagem - y / escala
+        self.ajustar(layout, altura, largura)
+
+    def deslocar(self, layout, altura, largura, dx, dy):
+        """
+        Arrasta a imagem (dx, dy) pixels do quadro.
+        """
+        escala = self.escala(layout)
+        self.x0 -= dx / escala
+        self.y0 -= dy / escala
+        self.ajustar(layout, altura, largura)
+
+def reduzir_pela_metade(imagem, destino=None):
+    """
+    Reduz a imagem à metade (arredondada para cima) pela média de cada bloco 2 x 2; numa borda de
+    tamanho ímpar, a última linha ou coluna é repetida. Assim, reduzir um recorte com cantos pares
+    dá exatamente os mesmos pixels que reduzir a imagem inteira.
+    """
+    compacta = isinstance(imagem, ImagemCanalUnico)
+    plano = imagem.plano if compacta else imagem
+    altura, largura = plano.shape[:2]
+    if altura % 2 or largura % 2:
+        plano = cv2.copyMakeBorder(plano, 0, altura % 2, 0, largura % 2, cv2.BORDER_REPLICATE)
+    par = ImagemCanalUnico(plano, imagem.canal) if compacta else plano
+    return redimensionar_compacta(par, ((largura + 1) // 2, (altura + 1) // 2), cv2.INTER_AREA, destino)
+
+class PiramideDeVisualizacao:
+    """
+    Níveis da imagem exibida, cada um com metade da largura e da altura do anterior, montados sob
+    demanda e guardados até a imagem mudar. O quadro é desenhado a partir do menor nível que ainda
+    tem resolução suficiente para o zoom, recortando só a região visível: o custo de redesenhar
+    depende do tamanho do quadro, não do tamanho da imagem nem do zoom.
+    """
+    def __init__(self, nome=None):
+        self.nome = nome  # Identifica os buffers dos níveis no pool; sem nome, cada nível tem o seu array.
+        self.niveis = []
+
+    def invalidar(self):
+        """
+        Descarta os níveis reduzidos (a imagem foi alterada no lugar).
+        """
+        del self.niveis[1:]
+
+    def definir(self, imagem):
+        if not self.niveis or self.niveis[0] is not imagem:
+            self.niveis = [imagem]
+
+    def nivel(self, escala):
+        """
+        Retorna o menor nível cuja resolução ainda é maior ou igual à 'escala' pedida.
+        """
+        k = 0 if escala >= 1.0 else int(np.floor(np.log2(1.0 / escala)))
+        while len(self.niveis) <= k:
+            anterior = self.niveis[-1]
+            altura, largura = anterior.shape[:2]
+            if min(altura, largura) < 2:
+                break
+            tamanho = ((largura + 1) // 2, (altura + 1) // 2)
+            # Os níveis ficam em buffers do pool, reaproveitados quando a imagem muda de novo.
+            forma = tamanho[::-1] + (() if isinstance(anterior, ImagemCanalUnico) else anterior.shape[2:])
+            destino = None if self.nome is None else pool_quadros.buffer((self.nome, len(self.niveis)), forma, anterior.dtype)
+            self.niveis.append(reduzir_pela_metade(anterior, destino))
+        return self.niveis[min(k, len(self.niveis) - 1)]
+
+    def atualizar_regiao(self, topo, base, esquerda, direita):
+        """
+        Refaz nos níveis já montados só a parte que cobre uma região alterada do nível 0
+        (como o retângulo de um adesivo), em vez de descartá-los e reduzir a imagem inteira de novo.
+        """
+        for k in range(1, len(self.niveis)):
+            anterior, nivel = self.niveis[k - 1], self.niveis[k]
+            # A região no nível k, ampliada para pixels inteiros, e a região correspondente no nível k - 1.
+            topo, esquerda = topo // 2, esquerda // 2
+            base, direita = min(nivel.shape[0], (base + 1) // 2), min(nivel.shape[1], (direita + 1) // 2)
+            recorte = anterior[2 * topo:min(anterior.shape[0], 2 * base), 2 * esquerda:min(anterior.shape[1], 2 * direita)]
+            nivel[topo:base, esquerda:direita] = reduzir_pela_metade(recorte)
+
+class DetalheEmResolucaoCheia:
+    """
+    Pirâmide da edição em resolução cheia, usada quando o zoom passa da resolução da proxy.
+    Montar a edição em resolução cheia (e os seus níveis) custa proporcional ao tamanho da imagem
+    original, então isso é feito em uma thread de fundo; até ficar pronta, o quadro continua sendo
+    desenhado a partir da proxy. Cada pirâmide vale para um estado da sessão (sessão, edição);
+    os adesivos colados depois só atualizam os seus retângulos.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.trava = threading.Lock()
+        self.chave = None     # (sessão, edição) da pirâmide pronta.
+        self.piramide = None
+        self.pedida = None    # (sessão, edição) da montagem em andamento.
+
+    def obter(self, sessao):
+        """
+        Retorna a pirâmide do estado atual da sessão, ou None enquanto ela é montada (pedindo a montagem).
+        """
+        chave = (sessao, sessao.edicao)
+        with self.trava:
+            if self.chave == chave:
+                return self.piramide
+            if self.pedida == chave:
+                return None
+            self.pedida = chave
+        self.executor.submit(self.montar, sessao, sessao.estado_atual())
         return None
 
-    # Aplica o filtro correspondente ao índice especificado.
-    if indice_filtro == 0:  # Filtro Original: Retorna a imagem sem alterações.
-        return imagem_base.copy()
-
-    elif indice_filtro == 1:  # Escala de Cinza: Converte a imagem para tons de cinza.
-        # Primeiro, converte para escala de cinza.
-        filtro = cv2.cvtColor(imagem_base, cv2.COLOR_BGR2GRAY)
-        # Em seguida, converte de volta para RGB para compatibilidade com as outras funções.
-        return cv2.cvtColor(filtro, cv2.COLOR_GRAY2BGR)
-
-    elif indice_filtro == 2:  # Inversão: Inverte as cores da imagem.
-        return cv2.bitwise_not(imagem_base)
-
-    elif indice_filtro == 3:  # Desfoque: Aplica um desfoque Gaussian Blur.
-        # Usa um kernel 15x15 e sigma padrão para suavizar a imagem.
-        return cv2.GaussianBlur(imagem_base, (15, 15), 0)
-
-    elif indice_filtro == 4:  # Efeito Tumblr: Aplica um mapa de cores rosa (COLORMAP_PINK).
-        return cv2.applyColorMap(imagem_base, cv2.COLORMAP_PINK)
-
-    elif indice_filtro == 5:  # Efeito Prism: Aplica um mapa de cores em arco-íris.
-        return cv2.applyColorMap(imagem_base, cv2.COLORMAP_RAINBOW)
-
-    elif indice_filtro == 6:  # Vintage: Aplica um efeito sépia para estilo retrô.
-        # Define a matriz de transformação de cores para o efeito sépia.
-        sepia_filter = np.array([[0.272, 0.534, 0.131],
-                                 [0.349, 0.686, 0.168],
-                                 [0.393, 0.769, 0.189]])
-        # Aplica a transformação de cores usando a matriz definida.
-        imagem_vintage = cv2.transform(imagem_base, sepia_filter)
-        # Clipa os valores para que permaneçam no intervalo de 0 a 255 (valores válidos para pixels).
-        return np.clip(imagem_vintage, 0, 255).astype(np.uint8)
-
-    elif indice_filtro == 7:  # Silly Face: Aumenta o brilho da imagem.
-        # Soma uma constante de 30 a todos os pixels da imagem, aumentando o brilho.
-        return cv2.add(imagem_base, np.full_like(imagem_base, 30))
-
-    elif indice_filtro == 8:  # Kyle+Kendall Slim: Aplica um filtro bilateral para suavização.
-        # Usa filtro bilateral com raio 15 e valores para sigmaColor e sigmaSpace iguais a 80.
-        return cv2.bilateralFilter(imagem_base, 15, 80, 80)
-
-    elif indice_filtro == 9:  # Filtro Kodak: Simula um efeito de cor quente.
-        # Cria uma tabela de look-up para aumentar os valores de intensidade.
-        lookup_table = np.array([min(i + 20, 255) for i in range(256)]).astype("uint8")
-        # Aplica a tabela de look-up à imagem, ajustando os valores.
-        return cv2.LUT(imagem_base, lookup_table)
-
-    elif indice_filtro == 10:  # Efeito Preto e Vermelho.
-        # Converte a imagem para escala de cinza.
-        gray = cv2.cvtColor(imagem_base, cv2.COLOR_BGR2GRAY)
-        # Cria uma imagem em vermelho com base na escala de cinza.
-        red_channel = np.zeros_like(gray)
-        # Combina os canais para criar o efeito preto e vermelho.
-        preto_vermelho = cv2.merge((red_channel, red_channel, gray))
-        return preto_vermelho
-
-    # Caso o índice não corresponda a nenhum filtro, retorna a imagem original.
-    return imagem_base
+    def montar(self, sessao, estado):
+        """
+        Roda na thread de fundo: monta a edição em resolução cheia e os níveis que o zoom pode pedir.
+        """
+        try:
+            imagem = sessao.resolucao_cheia_pronta()
+            if imagem is None:
+                imagem = sessao.montar_resolucao_cheia(estado)
+            if imagem is None:
+                return  # A edição mudou enquanto isso; o próximo desenho pede de novo.
+            piramide = PiramideDeVisualizacao()
+            piramide.definir(imagem)
+            # O menor nível usado é o da ampliação mínima do detalhe (os outros são maiores que ele).
+            piramide.nivel(ESCALA_MINIMA_DETALHE * sessao.escala_proxy)
+        except Exception as erro:
+            print(f"Erro ao montar a imagem em resolução cheia: {erro}")
+            return
+        with self.trava:
+            if sessao.resolucao_cheia_pronta() is not imagem:
+                return
+            self.chave, self.piramide = (sessao, estado[0]), piramide
+        solicitar_redesenho()
+
+    def adesivo_colado(self, sessao, edicao_anterior, regiao):
+        """
+        Depois de um adesivo: se a pirâmide era a do estado anterior e a sessão colou o adesivo
+        na mesma imagem em resolução cheia, atualiza só o retângulo dele nos níveis.
+        """
+        with self.trava:
+            if self.chave != (sessao, edicao_anterior) or sessao.resolucao_cheia_pronta() is not self.piramide.niveis[0]:
+                return
+            if regiao is not None:
+                self.piramide.atualizar_regiao(*regiao)
+            self.chave = (sessao, sessao.edicao)
+
+def renderizar_quadro(imagem, layout, visao, detalhe=None):
+    """
+    Desenha a região visível da imagem no tamanho do quadro de edição, a partir da pirâmide.
+    Só o recorte visível do nível escolhido é redimensionado, em um buffer reaproveitado;
+    o resultado pode ser uma vista desse buffer (ou do próprio nível, quando não há o que redimensionar).
+    'detalhe' é uma função que retorna a pirâmide da mesma imagem em resolução maior (a edição em
+    resolução cheia, no modo imagem), ou None se ela ainda não está pronta; só é chamada quando o
+    zoom amplia a imagem exibida em pelo menos ESCALA_MINIMA_DETALHE.
+    """
+    visao.ajustar(layout, *imagem.shape[:2])
+    escala = visao.escala(layout)
+    piramide = None
+    if escala >= ESCALA_MINIMA_DETALHE and detalhe is not None:
+        # Bem mais pixels no quadro do que na imagem exibida: a região visível vem da resolução maior.
+        piramide = detalhe()
+    if piramide is None:
+        piramide = piramide_visualizacao
+        piramide.definir(imagem)
+    fonte = piramide.niveis[0]
+    # As contas abaixo usam só a proporção entre o nível e a imagem exibida, então servem para as duas pirâmides.
+    nivel = piramide.nivel(escala * imagem.shape[1] / fonte.shape[1])
+    altura_nivel, largura_nivel = nivel.shape[:2]
+    # Pixels do quadro por pixel do nível (os arredondamentos das reduções deixam x e y um pouco diferentes).
+    fator_x = escala * imagem.shape[1] / largura_nivel
+    fator_y = escala * imagem.shape[0] / altura_nivel
+    # Região visível em pixels do nível, ampliada para pixels inteiros.
+    x_nivel = visao.x0 * largura_nivel / imagem.shape[1]
+    y_nivel = visao.y0 * altura_nivel / imagem.shape[0]
+    x_inicio, y_inicio = int(x_nivel), int(y_nivel)
+    x_fim = min(largura_nivel, int(np.ceil(x_nivel + layout.largura_quadro / fator_x)))
+    y_fim = min(altura_nivel, int(np.ceil(y_nivel + layout.altura_quadro / fator_y)))
+    recorte = nivel[y_inicio:y_fim, x_inicio:x_fim]
+    # Deslocamento, em pixels do quadro, entre o canto do recorte e o canto da região visível.
+    x_sobra = round((x_nivel - x_inicio) * fator_x)
+    y_sobra = round((y_nivel - y_inicio) * fator_y)
+    tamanho = (max(round((x_fim - x_inicio) * fator_x), x_sobra + layout.largura_quadro),
+               max(round((y_fim - y_inicio) * fator_y), y_sobra + layout.altura_quadro))
+    if tamanho != (x_fim - x_inicio, y_fim - y_inicio):
+        # O nível escolhido nunca é mais que duas vezes maior que o quadro, então a interpolação
+        # bilinear basta tanto para reduzir quanto para ampliar (e é bem mais rápida que a média por área).
+        forma = tamanho[::-1] + (() if isinstance(recorte, ImagemCanalUnico) else recorte.shape[2:])
+        recorte = redimensionar_compacta(recorte, tamanho, cv2.INTER_LINEAR,
+                                         pool_quadros.buffer("visualizacao_ampliada", forma, recorte.dtype))
+    return recorte[y_sobra:y_sobra + layout.altura_quadro, x_sobra:x_sobra + layout.largura_quadro]
+
+visao_quadro = VisaoDoQuadro()
+piramide_visualizacao = PiramideDeVisualizacao("piramide")
+detalhe_cheio = DetalheEmResolucaoCheia()  # Níveis da edição em resolução cheia, para o zoom.
+posicao_mouse = None  # Última posição do cursor na janela, usada pela roda do mouse e pelo arraste.
+
+def aplicar_adesivo_webcam(imagem_fundo, indice, x, y):
+    """
+    Coloca o adesivo de índice dado na cena da webcam, que é colada de novo em cada frame, e o cola
+    também no frame atual. Isso garante que o adesivo permaneça fixo na imagem, mesmo que o frame mude.
+    O tamanho do adesivo acompanha a resolução do frame.
+    """
+    adesivo = adesivos_compilados[indice]
+    instancia = cena_webcam.adicionar(adesivo, x, y, adesivo.escala_relativa(*imagem_fundo.shape[:2]))
+    compor_adesivo(imagem_fundo, instancia.adesivo, x, y)
 
 def salvar_imagem(imagem):
     """
     Salva a imagem atual na pasta que o usuário desejar.
     """
+    from tkinter import Tk, filedialog  # O Tkinter só é carregado quando a interface precisa dele.
+
     # Cria uma janela de diálogo para o usuário selecionar onde salvar a imagem.
     Tk().withdraw()  # Oculta a janela principal do Tkinter.
     caminho_salvar = filedialog.asksaveasfilename(
@@ -219,6 +378,9 @@ def salvar_imagem(imagem):
     )
     # Se o usuário escolheu um local para salvar:
     if caminho_salvar:
+        # Uma imagem de canal único é salva em cores; uma imagem em cinza é salva em cinza.
+        if isinstance(imagem, ImagemCanalUnico):
+            imagem = expandir_para_bgr(imagem)
         # Salva a imagem no caminho especificado.
         cv2.imwrite(caminho_salvar, imagem)
         # Exibe uma mensagem confirmando o local onde a imagem foi salva.
@@ -229,6 +391,7 @@ def iniciar_video_writer(frame):
     Inicializa o gravador de vídeo após o usuário escolher o local de salvamento.
     """
     global video_writer, video_filename, gravando_video
+    from tkinter import Tk, filedialog
 
     # Exibe uma janela para o usuário escolher onde salvar o vídeo.
     Tk().withdraw()  # Oculta a janela principal do Tkinter.
@@ -280,40 +443,181 @@ def desfazer_acao():
     """
     Desfaz a última ação do usuário, caso possível.
     """
-    global imagem_com_efeitos, historico_acao  # Referencia as variáveis globais necessárias.
+    global imagem_com_efeitos  # Referencia as variáveis globais necessárias.
 
-    # Verifica se há pelo menos uma ação no histórico além do estado inicial.
-    if len(historico_acao) > 1:
-        # Remove a última ação realizada do histórico.
-        historico_acao.pop()
-        # Define a imagem com efeitos como o estado anterior no histórico.
-        imagem_com_efeitos = historico_acao[-1].copy()
-        # Atualiza a interface para refletir as mudanças após desfazer a ação.
-        atualizar_janela()
+    # No modo webcam, desfazer tira da cena o último adesivo colocado (o próximo frame já sai sem ele).
+    if usando_webcam:
+        if cena_webcam is not None:
+            cena_webcam.remover_ultimo()
+        return
+
+    # Volta a sessão ao estado anterior, se houver alguma ação além do estado inicial.
+    if sessao is not None and sessao.desfazer():
+        imagem_com_efeitos = sessao.imagem_com_efeitos
+        # Desfazer um adesivo devolve os pixels na própria imagem: os níveis reduzidos ficaram velhos.
+        piramide_visualizacao.invalidar()
+        # Pede que a interface seja redesenhada para refletir as mudanças após desfazer a ação.
+        solicitar_redesenho()
+
+# Threads que calculam as miniaturas em segundo plano, para o editor abrir sem esperar por elas.
+pool_miniaturas = ThreadPoolExecutor(max_workers=NUM_TRABALHADORES)
+miniaturas_atualizadas = threading.Event()  # Avisa o laço da interface que uma miniatura nova ficou pronta.
+
+def reduzir_para_miniatura(imagem):
+    """
+    Reduz a imagem uma única vez para o tamanho das miniaturas (altura fixa de 80 pixels).
+    Retorna (reduzida, escala), com a escala média da redução, usada para ajustar os raios dos filtros.
+    """
+    # Define a largura de cada miniatura com base na largura da janela e no número de filtros.
+    largura_miniatura = LARGURA_JANELA // len(nomes_filtros)
+    altura, largura = imagem.shape[:2]
+    reduzida = cv2.resize(imagem, (largura_miniatura, 80), interpolation=cv2.INTER_AREA)
+    return reduzida, np.sqrt((largura_miniatura / largura) * (80 / altura))
+
+def calcular_miniatura(indice_filtro, reduzida, escala):
+    """
+    Aplica um filtro na imagem já reduzida ao tamanho da miniatura, com os raios de vizinhança
+    ajustados à escala, para que a miniatura pareça o filtro aplicado na imagem inteira.
+    """
+    filtro = filtros_registrados[indice_filtro].na_escala(escala)
+    return expandir_para_bgr(filtro.aplicar(reduzida))
 
 def gerar_miniaturas(imagem):
     """
     Gera miniaturas dos filtros disponíveis para exibição na barra de filtros.
+    A imagem é reduzida uma única vez ao tamanho da miniatura e os filtros são aplicados na
+    imagem reduzida, em paralelo. As miniaturas aparecem na barra à medida que ficam prontas
+    (as que faltam ficam vazias).
     """
     global miniaturas  # Declara a variável global que armazena as miniaturas dos filtros.
 
-    # Inicializa a lista de miniaturas como vazia.
-    miniaturas = []
+    # Reduz a imagem uma única vez para o tamanho da miniatura.
+    reduzida, escala = reduzir_para_miniatura(imagem)
+
+    # Começa com a barra vazia; cada miniatura é colocada na sua posição quando fica pronta.
+    # Uma nova chamada troca a lista, então resultados atrasados de uma imagem anterior são descartados.
+    lista = miniaturas = [None] * len(nomes_filtros)
+    compositor_janela.invalidar()
+
+    def guardar(indice_filtro, tarefa):
+        if tarefa.exception() is not None:
+            print(f"Erro ao gerar a miniatura do filtro {nomes_filtros[indice_filtro]}: {tarefa.exception()}")
+            return
+        lista[indice_filtro] = tarefa.result()
+        compositor_janela.invalidar()  # A barra de filtros precisa ser redesenhada.
+        miniaturas_atualizadas.set()
 
     # Itera sobre o número total de filtros disponíveis.
     for i in range(len(nomes_filtros)):
-        # Aplica o filtro correspondente ao índice atual na imagem base.
-        filtro_aplicado = aplicar_filtro_generico(imagem, i)
-        # Define a largura de cada miniatura com base na largura da janela e no número de filtros.
-        largura_miniatura = LARGURA_JANELA // len(nomes_filtros)
-        # Redimensiona a imagem filtrada para criar uma miniatura de altura fixa (80 pixels).
-        miniatura = cv2.resize(filtro_aplicado, (largura_miniatura, 80))
-        # Adiciona a miniatura gerada à lista global de miniaturas.
-        miniaturas.append(miniatura)
+        tarefa = pool_miniaturas.submit(calcular_miniatura, i, reduzida, escala)
+        tarefa.add_done_callback(lambda tarefa, i=i: guardar(i, tarefa))
+
+class AtualizadorDeMiniaturas(threading.Thread):
+    """
+    Thread que mantém as miniaturas da barra de filtros atualizadas no modo webcam.
+    Algumas vezes por segundo, pede ao laço de captura uma cópia já reduzida do quadro atual,
+    recalcula todas as miniaturas fora da thread da interface e troca a lista inteira de uma vez,
+    para que a barra nunca mostre miniaturas de quadros diferentes misturadas.
+    """
+    def __init__(self, frequencia=None):
+        super().__init__(daemon=True)  # Não impede o programa de terminar.
+        self.intervalo = 1.0 / (frequencia or FREQUENCIA_MINIATURAS_WEBCAM)  # Segundos entre atualizações.
+        self.quadro_novo = threading.Event()  # Sinaliza que há um quadro reduzido esperando.
+        self.reduzida = None                  # Último quadro reduzido entregue pelo laço de captura.
+        self.proxima = 0.0                    # Momento em que a próxima atualização pode começar.
+        self.ativo = True
+
+    def precisa_de_quadro(self):
+        """
+        Indica ao laço de captura se já é hora de entregar um quadro (teste barato, feito a cada quadro).
+        """
+        return self.ativo and not self.quadro_novo.is_set() and time.monotonic() >= self.proxima
+
+    def enviar(self, frame):
+        """
+        Entrega um quadro ao atualizador. Só a redução ao tamanho da miniatura roda na thread de captura;
+        a cópia reduzida não depende mais do buffer do quadro, que será sobrescrito.
+        """
+        self.reduzida = reduzir_para_miniatura(frame)
+        self.proxima = time.monotonic() + self.intervalo
+        self.quadro_novo.set()
+
+    def parar(self):
+        self.ativo = False
+        self.quadro_novo.set()  # Acorda a thread para ela terminar.
+
+    def run(self):
+        global miniaturas
+        while True:
+            self.quadro_novo.wait()
+            if not self.ativo:
+                return
+            reduzida, escala = self.reduzida
+            try:
+                novas = [calcular_miniatura(i, reduzida, escala) for i in range(len(nomes_filtros))]
+            except Exception as erro:
+                print(f"Erro ao atualizar as miniaturas: {erro}")
+            else:
+                miniaturas = novas  # Troca atômica: a barra vê a lista antiga ou a nova, nunca uma mistura.
+                compositor_janela.invalidar()
+                miniaturas_atualizadas.set()
+            self.quadro_novo.clear()
+
+class CompositorDaJanela:
+    """
+    Mantém a janela do editor montada entre uma atualização e outra (modo retido).
+    A moldura (adesivos, barra de filtros e botões) é desenhada uma vez em uma tela persistente
+    e só é redesenhada quando fica suja: mudou a seleção, chegaram miniaturas novas ou mudou o
+    tamanho do quadro. A cada atualização, só a região do quadro de edição é copiada para a tela.
+    """
+    def __init__(self, largura, altura):
+        self.largura = largura
+        self.tela = np.zeros((altura, largura, 3), dtype=np.uint8)
+        self.layout = None  # Layout para o qual a moldura foi desenhada.
+        self.suja = True
+
+    def invalidar(self):
+        """
+        Marca a moldura para ser redesenhada na próxima atualização. Pode ser chamada de qualquer thread:
+        uma marcação feita enquanto a moldura é desenhada vale para a atualização seguinte.
+        """
+        self.suja = True
+
+    def desenhar_moldura(self, layout):
+        """
+        Redesenha na tela tudo que não é o quadro de edição, nas posições dadas pelo layout.
+        """
+        self.tela.fill(0)
+        desenhar_area_adesivos(self.largura, self.tela[:ALTURA_ADESIVOS])
+        desenhar_barra_de_filtros(self.largura, self.tela[layout.y_barra:layout.y_barra + ALTURA_BARRA])
+        desenhar_botoes(self.tela, layout)
+
+    def compor(self, visualizacao, layout):
+        """
+        Coloca o quadro já reduzido (em BGR) na tela, no retângulo do layout, redesenhando a moldura
+        antes se ela estiver suja ou se o layout mudou. Retorna a tela, pronta para ser exibida.
+        """
+        if self.suja or self.layout is not layout:
+            self.suja = False  # Antes de desenhar: uma invalidação durante o desenho não se perde.
+            self.layout = layout
+            self.desenhar_moldura(layout)
+        self.tela[layout.y_quadro:layout.y_barra, layout.x_quadro:layout.x_quadro + layout.largura_quadro] = visualizacao
+        return self.tela
+
+compositor_janela = CompositorDaJanela(LARGURA_JANELA, ALTURA_JANELA)
+
+def solicitar_redesenho():
+    """
+    Marca a janela para ser redesenhada no próximo ciclo do laço da interface. Pedidos feitos
+    antes do redesenho se juntam em um só.
+    """
+    global janela_suja
+    janela_suja = True
 
 def atualizar_janela():
     """
     Atualiza a janela principal do editor, incluindo o frame atual e os elementos visuais.
+    A moldura vem pronta do compositor; só o quadro de edição é copiado a cada chamada.
     """
     global imagem_com_efeitos, usando_webcam  # Referencia as variáveis globais necessárias.
 
@@ -326,46 +630,38 @@ def atualizar_janela():
         # Salva o frame atual no arquivo de vídeo.
         salvar_frame_webcam(imagem_com_efeitos)
 
-    # Redimensiona a imagem para caber no quadro de edição, mantendo as proporções.
-    visualizacao = redimensionar_para_visualizacao(imagem_com_efeitos)
-    # Define a largura total da janela.
-    largura_total = LARGURA_JANELA
-    # Define a altura total da janela.
-    altura_total = ALTURA_JANELA
-
-    # Cria uma janela em branco (preta) com as dimensões da área de edição.
-    janela = np.zeros((altura_total, largura_total, 3), dtype=np.uint8)
-
-    # Calcula o deslocamento horizontal necessário para centralizar o quadro na janela.
-    x_offset_frame = (largura_total - visualizacao.shape[1]) // 2
-    # Define o deslocamento vertical do quadro, abaixo da área reservada aos adesivos.
-    y_offset_frame = ALTURA_ADESIVOS
-
-    # Preenche a parte superior da janela com as miniaturas dos adesivos.
-    janela[:ALTURA_ADESIVOS] = desenhar_area_adesivos(largura_total)
-    # Insere o frame redimensionado na área central da janela, abaixo dos adesivos.
-    janela[y_offset_frame:y_offset_frame + visualizacao.shape[0], x_offset_frame:x_offset_frame + visualizacao.shape[1]] = visualizacao
-    # Preenche a área abaixo do frame com as miniaturas dos filtros.
-    janela[y_offset_frame + visualizacao.shape[0]:y_offset_frame + visualizacao.shape[0] + ALTURA_BARRA] = desenhar_barra_de_filtros(largura_total)
-    # Desenha os botões "Salvar" e "Desfazer" na parte inferior da janela.
-    desenhar_botoes(janela, largura_total, y_offset_frame + visualizacao.shape[0] + ALTURA_BARRA)
+    # Desenha a região visível (com o zoom atual) no tamanho do quadro de edição.
+    layout = layout_da_janela(*imagem_com_efeitos.shape[:2])
+    # No modo imagem editado em proxy, o zoom além da proxy é desenhado a partir da resolução cheia.
+    detalhe = None
+    if not usando_webcam and sessao is not None and sessao.escala_proxy < 1.0:
+        detalhe = lambda: detalhe_cheio.obter(sessao)
+    visualizacao = renderizar_quadro(imagem_com_efeitos, layout, visao_quadro, detalhe)
+    # Formas compactas só viram BGR aqui, já no tamanho de exibição, em um buffer reaproveitado.
+    visualizacao = expandir_para_bgr(visualizacao, pool_quadros.buffer("visualizacao", visualizacao.shape[:2] + (3,)))
+
+    # Copia o quadro para a tela persistente (a moldura só é redesenhada quando muda).
+    janela = compositor_janela.compor(visualizacao, layout)
 
     # Exibe a janela do editor atualizada com os elementos visuais montados.
     cv2.imshow("Editor", janela)
 
-def desenhar_area_adesivos(largura):
+def desenhar_area_adesivos(largura, destino=None):
     """
     Cria a área horizontal com as miniaturas dos adesivos disponíveis.
+    Desenha direto em 'destino' (a faixa correspondente da janela), se fornecido.
     """
-    # Cria uma área preta (vazia) com altura fixa para exibir os adesivos.
-    area = np.zeros((ALTURA_ADESIVOS, largura, 3), dtype=np.uint8)
+    # Cria uma área preta (vazia) com altura fixa para exibir os adesivos, ou usa a faixa já limpa da janela.
+    area = np.zeros((ALTURA_ADESIVOS, largura, 3), dtype=np.uint8) if destino is None else destino
     # Define o deslocamento horizontal inicial para posicionar os adesivos.
     x_offset = 10
 
-    # Itera sobre os adesivos carregados, junto com seus índices e nomes.
-    for i, (nome, adesivo) in enumerate(adesivos.items()):
-        # Redimensiona o adesivo para um tamanho fixo de 80x80 pixels.
-        adesivo_redimensionado = cv2.resize(adesivo[:, :, :3], (80, 80))
+    # Redimensiona os adesivos para um tamanho fixo de 80x80 pixels uma única vez.
+    if not miniaturas_adesivos:
+        miniaturas_adesivos.extend(cv2.resize(adesivo[:, :, :3], (80, 80)) for adesivo in adesivos.values())
+
+    # Itera sobre as miniaturas dos adesivos, junto com seus índices.
+    for i, adesivo_redimensionado in enumerate(miniaturas_adesivos):
         # Insere o adesivo redimensionado na área horizontal, com deslocamento calculado.
         area[10:90, x_offset:x_offset + 80] = adesivo_redimensionado
         # Desenha um contorno verde ao redor do adesivo selecionado atualmente.
@@ -377,14 +673,15 @@ def desenhar_area_adesivos(largura):
     # Retorna a área preenchida com os adesivos e seus contornos.
     return area
 
-def desenhar_barra_de_filtros(largura):
+def desenhar_barra_de_filtros(largura, destino=None):
     """
     Cria a barra horizontal com as miniaturas dos filtros disponíveis.
+    Desenha direto em 'destino' (a faixa correspondente da janela), se fornecido.
     """
     global miniaturas  # Referencia a lista global de miniaturas.
 
-    # Cria uma área preta (vazia) com altura fixa para exibir as miniaturas dos filtros.
-    barra = np.zeros((ALTURA_BARRA, largura, 3), dtype=np.uint8)
+    # Cria uma área preta (vazia) com altura fixa para exibir as miniaturas dos filtros, ou usa a faixa da janela.
+    barra = np.zeros((ALTURA_BARRA, largura, 3), dtype=np.uint8) if destino is None else destino
     # Define a largura de cada miniatura com base na largura total da janela e no número de filtros.
     largura_miniatura = largura // len(nomes_filtros)
     # Define o deslocamento horizontal inicial para posicionar as miniaturas dos filtros.
@@ -394,30 +691,28 @@ def desenhar_barra_de_filtros(largura):
     for i, miniatura in enumerate(miniaturas):
         # Verifica se a miniatura está disponível (não é None).
         if miniatura is not None:
-            # Redimensiona a miniatura para a largura calculada, mantendo a altura fixa (80 pixels).
-            miniatura_redimensionada = cv2.resize(miniatura, (largura_miniatura, 80))
+            # Redimensiona a miniatura para a largura calculada, mantendo a altura fixa (80 pixels),
+            # só quando ela ainda não foi gerada nesse tamanho.
+            miniatura_redimensionada = miniatura
+            if miniatura.shape[:2] != (80, largura_miniatura):
+                miniatura_redimensionada = cv2.resize(miniatura, (largura_miniatura, 80))
             # Insere a miniatura redimensionada na barra, com deslocamento calculado.
             barra[10:90, x_offset:x_offset + largura_miniatura] = miniatura_redimensionada
-        # Desenha um contorno verde ao redor da miniatura correspondente ao filtro selecionado atualmente.
-        if i == indice_filtro_atual:
+        # Desenha um contorno verde ao redor das miniaturas dos filtros empilhados atualmente.
+        if i in indices_cadeia:
             cv2.rectangle(barra, (x_offset, 10), (x_offset + largura_miniatura, 90), (0, 255, 0), 2)
         # Incrementa o deslocamento horizontal para posicionar a próxima miniatura.
         x_offset += largura_miniatura
 
     return barra  # Retorna a barra preenchida com miniaturas e contornos.
-def desenhar_botoes(janela, largura, y_offset):
+def desenhar_botoes(janela, layout):
     """
     Desenha os botões "Salvar" e "Desfazer" na interface, abaixo da barra de filtros.
     """
-    # Define a largura e altura dos botões, além do espaçamento horizontal entre eles.
-    botao_largura = 200
+    # As posições dos botões vêm do layout, o mesmo usado para saber se um clique caiu neles.
+    botao_largura = LARGURA_BOTAO
     botao_altura = ALTURA_BOTOES
-    espaco = 20
-
-    # Calcula a posição horizontal do botão "Salvar", centralizando-o com margem à esquerda.
-    x_salvar = (largura // 2) - botao_largura - espaco
-    # Calcula a posição horizontal do botão "Desfazer", centralizando-o com margem à direita.
-    x_desfazer = (largura // 2) + espaco
+    x_salvar, x_desfazer, y_offset = layout.x_salvar, layout.x_desfazer, layout.y_botoes
 
     # Desenha o botão "Salvar" como um retângulo preenchido na janela, usando uma cor cinza claro.
     cv2.rectangle(janela, (x_salvar, y_offset), (x_salvar + botao_largura, y_offset + botao_altura), (200, 200, 200), -1)
@@ -431,108 +726,131 @@ def desenhar_botoes(janela, largura, y_offset):
 def callback_mouse(evento, x, y, flags, parametros):
     """
     Lida com cliques do mouse na interface, permitindo interação com adesivos, filtros e botões.
+    A roda do mouse amplia o quadro de edição em torno do cursor e o botão direito arrastado desloca a imagem.
+    Os eventos só marcam a janela como suja: o laço da interface a redesenha uma vez por ciclo,
+    mesmo que vários eventos cheguem nesse intervalo.
     """
-    global imagem_com_efeitos, imagem_original, imagem_com_adesivos, historico_acao
-    global indice_adesivo_atual, indice_filtro_atual, gravando_video  # Declara as variáveis globais necessárias.
+    global imagem_com_efeitos
+    global indice_adesivo_atual, gravando_video  # Declara as variáveis globais necessárias.
+    global indices_cadeia, cadeia_atual, posicao_mouse
+
+    # Layout da janela (o mesmo usado para desenhá-la), calculado só com aritmética sobre o tamanho da imagem.
+    layout = layout_da_janela(*imagem_com_efeitos.shape[:2])
+
+    # Movimento com o botão direito pressionado: desloca a imagem ampliada.
+    if evento == cv2.EVENT_MOUSEMOVE:
+        if flags & cv2.EVENT_FLAG_RBUTTON and posicao_mouse is not None and visao_quadro.zoom > 1.0:
+            visao_quadro.deslocar(layout, *imagem_com_efeitos.shape[:2], x - posicao_mouse[0], y - posicao_mouse[1])
+            solicitar_redesenho()
+        posicao_mouse = (x, y)  # A roda do mouse usa a última posição conhecida do cursor.
+        return
+
+    # Roda do mouse sobre o quadro: amplia ou reduz mantendo parado o ponto sob o cursor.
+    if evento == cv2.EVENT_MOUSEWHEEL:
+        regiao = layout.regiao(*posicao_mouse) if posicao_mouse is not None else None
+        if regiao is not None and regiao[0] == "quadro":
+            # O sentido da roda vem nos bits altos de 'flags': positivo para a frente (ampliar).
+            fator = PASSO_ZOOM if flags > 0 else 1.0 / PASSO_ZOOM
+            visao_quadro.ampliar(layout, *imagem_com_efeitos.shape[:2], regiao[1], regiao[2], fator)
+            solicitar_redesenho()
+        return
 
     # Detecta cliques do botão esquerdo do mouse.
     if evento == cv2.EVENT_LBUTTONDOWN:
-        # Calcula a altura da área de visualização, baseada na imagem redimensionada.
-        visualizacao_altura = redimensionar_para_visualizacao(imagem_com_efeitos).shape[0]
-        # Calcula a posição horizontal inicial do quadro redimensionado.
-        x_offset_frame = (LARGURA_JANELA - LARGURA_FRAME) // 2
-        # Calcula a posição vertical inicial do quadro redimensionado.
-        y_offset_frame = ALTURA_ADESIVOS
+        # Descobre onde foi o clique pelo layout, sem redimensionar a imagem.
+        regiao = layout.regiao(x, y)
+        if regiao is None:
+            return  # O clique não caiu em nenhum elemento da interface.
 
         # Se o clique ocorrer na área dos adesivos:
-        if 0 <= y <= ALTURA_ADESIVOS:
-            # Calcula o índice do adesivo clicado com base na posição horizontal.
-            indice = x // 90
-            # Verifica se o índice está dentro da faixa de adesivos disponíveis.
-            if indice < len(adesivos):
-                # Atualiza o índice do adesivo atual.
-                indice_adesivo_atual = indice
-                # Se estiver usando a webcam e o vídeo não estiver sendo gravado, inicia a gravação.
-                if usando_webcam and not gravando_video:
-                    iniciar_video_writer(imagem_com_efeitos)
-                # Atualiza a interface para refletir a seleção do adesivo.
-                atualizar_janela()
+        if regiao[0] == "adesivo":
+            # Atualiza o índice do adesivo atual (o contorno verde muda de lugar).
+            indice_adesivo_atual = regiao[1]
+            compositor_janela.invalidar()
+            # Se estiver usando a webcam e o vídeo não estiver sendo gravado, inicia a gravação.
+            if usando_webcam and not gravando_video:
+                iniciar_video_writer(imagem_com_efeitos)
+            # Pede que a interface seja redesenhada para refletir a seleção do adesivo.
+            solicitar_redesenho()
 
         # Se o clique ocorrer na área do quadro de edição:
-        elif y_offset_frame <= y <= y_offset_frame + visualizacao_altura:
-            # Calcula a posição horizontal correspondente na imagem original.
-            x_original = int((x - x_offset_frame) / escala_visualizacao)
-            # Calcula a posição vertical correspondente na imagem original.
-            y_original = int((y - y_offset_frame) / escala_visualizacao)
-            # Obtém o adesivo selecionado com base no índice atual.
-            adesivo = list(adesivos.values())[indice_adesivo_atual]
-
+        elif regiao[0] == "quadro":
+            # Posição correspondente na imagem exibida (a proxy, no modo imagem), considerando o zoom.
+            x_imagem, y_imagem = visao_quadro.para_imagem(layout, regiao[1], regiao[2])
             # Se estiver usando a webcam:
             if usando_webcam:
-                # Aplica o adesivo à camada de adesivos da webcam.
-                aplicar_adesivo_webcam(imagem_com_efeitos, adesivo, x_original, y_original)
+                # Coloca o adesivo na cena de adesivos da webcam.
+                aplicar_adesivo_webcam(imagem_com_efeitos, indice_adesivo_atual, int(x_imagem), int(y_imagem))
                 # Se o vídeo ainda não estiver sendo gravado, inicia a gravação.
                 if not gravando_video:
                     iniciar_video_writer(imagem_com_efeitos)
             else:
-                # Adiciona o estado atual da imagem ao histórico antes de aplicar o adesivo.
-                historico_acao.append(imagem_com_efeitos.copy())
-                # Aplica o adesivo diretamente na imagem atual.
-                aplicar_adesivo(imagem_com_efeitos, adesivo, x_original, y_original)
-
-            # Atualiza a interface para refletir a aplicação do adesivo.
-            atualizar_janela()
+                # A posição vai para a imagem original antes de arredondar, para que o zoom dê precisão
+                # de pixel da resolução cheia. A sessão guarda o estado anterior no histórico, cola o adesivo
+                # (com o tamanho relativo à imagem original) e registra a operação para refazê-la ao salvar.
+                x_original, y_original = int(x_imagem / sessao.escala_proxy), int(y_imagem / sessao.escala_proxy)
+                edicao_anterior = sessao.edicao
+                imagem_com_efeitos = sessao.colar_adesivo(indice_adesivo_atual, x_original, y_original)
+                # Os níveis da resolução cheia só são refeitos no retângulo do adesivo.
+                detalhe_cheio.adesivo_colado(sessao, edicao_anterior,
+                                             sessao.regiao_do_adesivo(indice_adesivo_atual, x_original, y_original))
+
+            # A imagem mudou no lugar: os níveis reduzidos da visualização são refeitos.
+            piramide_visualizacao.invalidar()
+            # Pede que a interface seja redesenhada para refletir a aplicação do adesivo.
+            solicitar_redesenho()
 
         # Se o clique ocorrer na área da barra de filtros:
-        elif y_offset_frame + visualizacao_altura < y <= y_offset_frame + visualizacao_altura + ALTURA_BARRA:
-            # Calcula o índice do filtro clicado com base na posição horizontal.
-            indice_filtro = x // (LARGURA_JANELA // len(nomes_filtros))
-            # Verifica se o índice está dentro da faixa de filtros disponíveis.
-            if indice_filtro < len(nomes_filtros):
-                # Atualiza o índice do filtro atual.
-                indice_filtro_atual = indice_filtro
-
-                # Se estiver usando a webcam:
-                if usando_webcam:
-                    # Aplica o filtro à imagem atual.
-                    imagem_com_efeitos = aplicar_filtro_generico(imagem_com_efeitos, indice_filtro_atual)
-                    # Se o vídeo ainda não estiver sendo gravado, inicia a gravação.
-                    if not gravando_video:
-                        iniciar_video_writer(imagem_com_efeitos)
-                else:
-                    # Aplica o filtro à imagem original e armazena o estado no histórico.
-                    imagem_com_efeitos = aplicar_filtro_generico(imagem_original, indice_filtro_atual)
-                    historico_acao.append(imagem_com_efeitos.copy())
-
-                # Atualiza a interface para refletir a aplicação do filtro.
-                atualizar_janela()
-
-        # Se o clique ocorrer na área dos botões:
-        elif y_offset_frame + visualizacao_altura + ALTURA_BARRA <= y <= y_offset_frame + visualizacao_altura + ALTURA_BARRA + ALTURA_BOTOES:
-            # Calcula as posições horizontais dos botões "Salvar" e "Desfazer".
-            largura_botoes = 200
-            espaco_botoes = 20
-            x_salvar = (LARGURA_JANELA // 2) - largura_botoes - espaco_botoes
-            x_desfazer = (LARGURA_JANELA // 2) + espaco_botoes
-
-            # Se o clique ocorrer no botão "Salvar":
-            if x_salvar <= x <= x_salvar + largura_botoes:
-                # Se estiver usando a webcam e o vídeo estiver sendo gravado, finaliza a gravação.
-                if usando_webcam and gravando_video:
-                    finalizar_video_writer()
-                else:
-                    # Salva a imagem atual.
-                    salvar_imagem(imagem_com_efeitos)
-            # Se o clique ocorrer no botão "Desfazer":
-            elif x_desfazer <= x <= x_desfazer + largura_botoes:
-                # Desfaz a última ação realizada.
-                desfazer_acao()  # Chama a função para desfazer a última ação realizada pelo usuário.
+        elif regiao[0] == "filtro":
+            # Índice do filtro clicado, calculado pelo layout a partir da posição horizontal.
+            indice_filtro = regiao[1]
+            # Com Shift pressionado, empilha o filtro sobre os anteriores; sem Shift, substitui a pilha.
+            if flags & cv2.EVENT_FLAG_SHIFTKEY and indice_filtro != 0:
+                indices_cadeia = [i for i in indices_cadeia if i != 0] + [indice_filtro]
+            else:
+                indices_cadeia = [indice_filtro]
+            compositor_janela.invalidar()  # Os contornos da barra de filtros mudam.
+
+            # Se estiver usando a webcam:
+            if usando_webcam:
+                # Monta (e funde) a cadeia uma única vez, fora do laço de quadros, na qualidade rápida.
+                cadeia_atual = montar_cadeia(indices_cadeia, QUALIDADE_WEBCAM)
+                # Aplica a cadeia à imagem atual (em BGR, pois o quadro também vai para o vídeo).
+                imagem_com_efeitos = expandir_para_bgr(cadeia_atual.aplicar(imagem_com_efeitos))
+                # Se o vídeo ainda não estiver sendo gravado, inicia a gravação.
+                if not gravando_video:
+                    iniciar_video_writer(imagem_com_efeitos)
+            else:
+                # A sessão aplica a cadeia à imagem proxy na qualidade exata (em faixas paralelas, se for grande;
+                # um filtro já visto nesta imagem vem direto do cache), guarda o estado no histórico
+                # e registra o filtro, para refazê-lo na resolução cheia ao salvar.
+                imagem_com_efeitos = sessao.aplicar_filtros(indices_cadeia)
+
+            # Pede que a interface seja redesenhada para refletir a aplicação do filtro.
+            solicitar_redesenho()
+
+        # Se o clique ocorrer no botão "Salvar":
+        elif regiao[0] == "salvar":
+            # Se estiver usando a webcam e o vídeo estiver sendo gravado, finaliza a gravação.
+            if usando_webcam and gravando_video:
+                finalizar_video_writer()
+            elif usando_webcam:
+                # Salva o frame atual, como está no quadro.
+                salvar_imagem(imagem_com_efeitos)
+            elif sessao is not None:
+                # Salva a imagem editada, refazendo as operações na resolução cheia.
+                salvar_imagem(sessao.renderizar_resolucao_cheia())
+        # Se o clique ocorrer no botão "Desfazer":
+        elif regiao[0] == "desfazer":
+            # Desfaz a última ação realizada.
+            desfazer_acao()  # Chama a função para desfazer a última ação realizada pelo usuário.
 
 def carregar_imagem_e_iniciar():
     """
     Permite ao usuário carregar uma imagem do sistema de arquivos e inicializa o editor para manipulação da imagem.
     """
-    global imagem_original, imagem_com_efeitos, miniaturas, historico_acao  # Declara as variáveis globais necessárias.
+    global imagem_com_efeitos, miniaturas, sessao, janela_suja  # Declara as variáveis globais necessárias.
+    from tkinter import Tk, filedialog  # Só a interface usa o Tkinter.
 
     # Esconde a janela principal do Tkinter para não interferir na seleção de arquivos.
     Tk().withdraw()
@@ -554,10 +872,14 @@ def carregar_imagem_e_iniciar():
         print("Erro ao carregar a imagem.")  # Exibe uma mensagem de erro no console.
         return  # Sai da função sem prosseguir.
 
-    # Cria uma cópia da imagem original para ser usada nas manipulações.
-    imagem_com_efeitos = imagem_original.copy()
-    # Inicializa o histórico de ações com a imagem original.
-    historico_acao = [imagem_com_efeitos.copy()]
+    # A sessão cria a cópia reduzida usada na interação (a resolução cheia só é processada ao salvar,
+    # ou em segundo plano para o zoom) e inicializa o histórico. Cada imagem tem uma sessão nova, com
+    # o seu cache: uma montagem em resolução cheia ainda em andamento fica com a sessão anterior.
+    sessao = SessaoEditor(adesivos_compilados, (LARGURA_FRAME, ALTURA_FRAME) if EDICAO_EM_PROXY else None)
+    sessao.carregar(imagem_original)
+    imagem_com_efeitos = sessao.imagem_com_efeitos
+    # A nova imagem começa inteira visível, sem zoom.
+    visao_quadro.reiniciar()
     # Gera miniaturas dos filtros disponíveis para exibição na interface.
     gerar_miniaturas(imagem_original)
 
@@ -565,13 +887,22 @@ def carregar_imagem_e_iniciar():
     cv2.namedWindow("Editor")
     # Associa a função de callback do mouse à janela do editor para capturar interações do usuário.
     cv2.setMouseCallback("Editor", callback_mouse)
-    # Atualiza a interface para exibir a imagem carregada e os elementos iniciais.
-    atualizar_janela()
+    # Pede o primeiro desenho da imagem carregada e dos elementos iniciais.
+    solicitar_redesenho()
 
     # Loop principal para manter a interface do editor aberta.
     while True:
-        # Aguarda por eventos de teclado.
-        if cv2.waitKey(1) & 0xFF == 27:  # Verifica se a tecla "ESC" foi pressionada.
+        # Redesenha a janela quando chegam miniaturas calculadas em segundo plano.
+        if miniaturas_atualizadas.is_set():
+            miniaturas_atualizadas.clear()
+            solicitar_redesenho()
+        # Redesenha no máximo uma vez por ciclo, e só se algo mudou desde o último desenho.
+        if janela_suja:
+            janela_suja = False
+            atualizar_janela()
+        # Dorme até o próximo ciclo processando os eventos da janela (mouse e teclado), sem ocupar
+        # o processador enquanto o usuário não faz nada.
+        if cv2.waitKey(INTERVALO_QUADRO_MS) & 0xFF == 27:  # Verifica se a tecla "ESC" foi pressionada.
             cv2.destroyAllWindows()  # Fecha todas as janelas abertas pelo OpenCV.
             exit(0)  # Finaliza completamente o programa.
 
@@ -579,9 +910,12 @@ def inicializar_webcam():
     """
     Inicializa a webcam para captura de vídeo em tempo real, permitindo a aplicação de filtros e adesivos.
     """
-    global usando_webcam, imagem_com_efeitos, imagem_com_adesivos, miniaturas  # Declara as variáveis globais necessárias.
+    global usando_webcam, imagem_com_efeitos, miniaturas  # Declara as variáveis globais necessárias.
+    global cadeia_atual, cena_webcam, janela_suja
 
     usando_webcam = True  # Define que o programa está no modo de uso da webcam.
+    # Remonta a cadeia com a qualidade de pré-visualização, para manter a taxa de quadros.
+    cadeia_atual = montar_cadeia(indices_cadeia, QUALIDADE_WEBCAM)
     # Tenta abrir a webcam para captura de vídeo.
     captura = cv2.VideoCapture(0)
     # Verifica se a webcam foi aberta com sucesso.
@@ -596,10 +930,13 @@ def inicializar_webcam():
         print("Erro ao capturar o frame inicial.")  # Exibe uma mensagem de erro no console.
         return  # Sai da função sem prosseguir.
 
-    # Inicializa uma camada vazia para armazenar adesivos aplicados na webcam.
-    imagem_com_adesivos = np.zeros_like(frame)
+    # Começa com a cena vazia; os adesivos colocados são colados em cada frame.
+    cena_webcam = CenaDeAdesivos()
     # Gera miniaturas dos filtros disponíveis com base no frame inicial capturado.
     gerar_miniaturas(frame)
+    # A partir daí, as miniaturas são atualizadas em segundo plano com quadros recentes.
+    atualizador_miniaturas = AtualizadorDeMiniaturas()
+    atualizador_miniaturas.start()
 
     # Cria uma janela OpenCV chamada "Editor" para exibir a interface do editor.
     cv2.namedWindow("Editor")
@@ -608,25 +945,39 @@ def inicializar_webcam():
 
     # Loop principal para processar frames da webcam em tempo real.
     while True:
-        # Captura um novo frame da webcam.
-        ret, frame = captura.read()
+        # Captura um novo frame da webcam no buffer do frame anterior.
+        ret, frame = captura.read(frame)
         # Se a captura falhar, sai do loop.
         if not ret:
             break
 
-        # Aplica o filtro selecionado ao frame capturado.
-        frame_com_filtro = aplicar_filtro_generico(frame, indice_filtro_atual)
-        # Combina o frame com filtro com a camada de adesivos.
-        imagem_com_efeitos = cv2.add(frame_com_filtro, imagem_com_adesivos)
+        # Aplica a cadeia de filtros selecionada ao frame capturado, no buffer do resultado do frame anterior
+        # (as etapas intermediárias também reaproveitam os seus buffers no pool de quadros).
+        resultado = cadeia_atual.aplicar(frame, pool_quadros.reciclar("webcam_filtro"), pool_quadros)
+        pool_quadros.guardar("webcam_filtro", resultado)
+        # Formas compactas viram BGR em um buffer fixo.
+        frame_com_filtro = expandir_para_bgr(resultado, pool_quadros.buffer("webcam_bgr", frame.shape))
+        # Cola os adesivos da cena direto no frame com filtro (um buffer do pool, refeito a cada frame),
+        # misturando no lugar só os retângulos dos adesivos, sem camadas nem cópias do frame inteiro.
+        cena_webcam.compor(frame_com_filtro)
+        imagem_com_efeitos = frame_com_filtro
+        # O frame é gravado sempre no mesmo buffer: os níveis reduzidos da visualização são refeitos.
+        piramide_visualizacao.invalidar()
+
+        # Entrega uma cópia reduzida do frame ao atualizador de miniaturas, quando for a hora.
+        if atualizador_miniaturas.precisa_de_quadro():
+            atualizador_miniaturas.enviar(frame)
 
         # Salva o frame processado no arquivo de vídeo, se a gravação estiver ativa.
         salvar_frame_webcam(imagem_com_efeitos)
-        # Atualiza a interface para exibir o frame processado.
+        # Cada frame novo já é um redesenho: atende de uma vez os pedidos feitos pelos eventos desde o anterior.
+        janela_suja = False
         atualizar_janela()
 
         # Verifica se a tecla "ESC" foi pressionada para sair.
         if cv2.waitKey(1) & 0xFF == 27:  # 27 é o código ASCII para "ESC".
             captura.release()  # Libera a webcam.
+            atualizador_miniaturas.parar()  # Encerra a atualização das miniaturas.
             finalizar_video_writer()  # Finaliza o arquivo de vídeo, se estiver sendo gravado.
             cv2.destroyAllWindows()  # Fecha todas as janelas abertas pelo OpenCV.
             exit(0)  # Finaliza completamente o programa.
@@ -635,6 +986,8 @@ def escolher_modo():
     """
     Exibe uma interface gráfica inicial para o usuário escolher entre carregar uma imagem ou usar a webcam.
     """
+    from tkinter import Tk, Button, Label  # Só a interface usa o Tkinter.
+
     # Cria uma janela do Tkinter para a seleção do modo.
     root = Tk()
     root.title("Escolha o Modo")  # Define o título da janela.
@@ -655,11 +1008,54 @@ def escolher_modo():
     # Exibe a janela e aguarda interação do usuário.
     root.mainloop()
 
+def numero_positivo(texto):
+    """
+    Converte um argumento da linha de comando em um número finito maior que zero (para o argparse).
+    """
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"número inválido: {texto!r}")
+    if not 0 < valor < float("inf"):  # Também rejeita nan e infinito.
+        raise argparse.ArgumentTypeError(f"precisa ser um número finito maior que zero: {texto!r}")
+    return valor
+
 def main():
     """
     Ponto de entrada do programa principal.
     Essa função é responsável por iniciar o programa e exibir a interface inicial ao usuário.
+    Com a opção --faixas, processa uma imagem gigante direto do disco, sem abrir a interface.
     """
+    global FREQUENCIA_MINIATURAS_WEBCAM
+    parser = argparse.ArgumentParser(description="Editor de imagens com filtros e adesivos.")
+    parser.add_argument("--faixas", nargs=2, metavar=("ENTRADA", "SAIDA"),
+                        help="aplica os filtros em faixas, sem carregar a imagem inteira (saída .npy, .ppm ou .pgm)")
+    parser.add_argument("--filtros", default="0",
+                        help="índices dos filtros a empilhar, separados por vírgula (padrão: 0)")
+    parser.add_argument("--altura-faixa", type=int, default=ALTURA_FAIXA_DISCO,
+                        help="linhas processadas por vez no modo em faixas")
+    parser.add_argument("--miniaturas-hz", type=numero_positivo, default=FREQUENCIA_MINIATURAS_WEBCAM,
+                        help="atualizações por segundo das miniaturas no modo webcam (padrão: 2)")
+    argumentos = parser.parse_args()
+    FREQUENCIA_MINIATURAS_WEBCAM = argumentos.miniaturas_hz
+
+    # Registra os filtros de LUT (se houver a pasta), antes de qualquer uso dos índices do registro.
+    if os.path.isdir(PASTA_LUTS):
+        registrar_luts()
+
+    if argumentos.faixas:
+        indices = [int(indice) for indice in argumentos.filtros.split(",")]
+        processar_em_faixas(*argumentos.faixas, montar_cadeia(indices), argumentos.altura_faixa)
+        return
+
+    # Carrega e compila os adesivos usados pela interface.
+    try:
+        adesivos.update(carregar_adesivos())
+    except OSError as erro:
+        print(erro)
+        exit(1)
+    adesivos_compilados.extend(compilar_adesivo(nome, imagem) for nome, imagem in adesivos.items())
+
     escolher_modo()  # Invoca a função que exibe a interface para o usuário escolher entre carregar uma imagem ou usar a webcam.
 
 if __name__ == "__main__":
@@ -0,0 +1,1853 @@
+"""
+Núcleo de processamento do editor de imagens: filtros e cadeias de filtros, execução em faixas,
+cache de resultados, LUTs 3D, adesivos compilados e a sessão de edição.
+
+Não depende da interface: importar este módulo não abre janelas, não lê arquivos e não encerra
+o programa, então ele pode ser usado em threads, processos de trabalho ou servidores. A interface
+(Trabalho Final GB.py) é uma camada em volta dele, e só ela carrega o Tkinter e abre janelas.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# ---------------------------------------
+# Registro de filtros
+# ---------------------------------------
+
+# Valores de entrada possíveis para as tabelas de look-up (0 a 255).
+valores_pixel = np.arange(256, dtype=np.int16)
+
+# Níveis de qualidade dos filtros caros: a versão exata é usada para salvar e a rápida na pré-visualização.
+QUALIDADE_EXATA = "exata"
+QUALIDADE_RAPIDA = "rapida"
+QUALIDADE_WEBCAM = QUALIDADE_RAPIDA  # Qualidade usada no laço de quadros da webcam.
+
+# ---------------------------------------
+# Representações compactas de imagens
+# ---------------------------------------
+# Filtros cujo resultado é intrinsecamente de um canal devolvem formas compactas:
+# uma matriz 2D para tons de cinza (os três canais iguais) ou uma ImagemCanalUnico quando
+# só um canal é diferente de zero. A conversão para BGR completo só acontece na exibição,
+# ao colar adesivos e ao salvar, de preferência em um buffer reaproveitado.
+
+class ImagemCanalUnico:
+    """
+    Imagem BGR em que só um canal tem valores e os outros dois são zero, guardada como um
+    único plano. Ocupa um terço da memória de uma imagem BGR nas cópias do histórico e do cache.
+    """
+    ndim = 3  # Do ponto de vista de quem a usa, continua sendo uma imagem de três canais.
+
+    def __init__(self, plano, canal):
+        self.plano = plano  # Valores do único canal não nulo.
+        self.canal = canal  # Índice desse canal (0 = azul, 1 = verde, 2 = vermelho).
+
+    @property
+    def shape(self):
+        return self.plano.shape + (3,)
+
+    @property
+    def dtype(self):
+        return self.plano.dtype
+
+    @property
+    def nbytes(self):
+        return self.plano.nbytes  # Só o plano ocupa memória.
+
+    @property
+    def flags(self):
+        return self.plano.flags
+
+    def copy(self):
+        return ImagemCanalUnico(self.plano.copy(), self.canal)
+
+    def __getitem__(self, fatia):
+        return ImagemCanalUnico(self.plano[fatia], self.canal)  # Recortes de linhas e colunas.
+
+    def __setitem__(self, fatia, valor):
+        self.plano[fatia] = valor.plano
+
+def expandir_para_bgr(imagem, destino=None):
+    """
+    Converte uma imagem em forma compacta para BGR de três canais, gravando em 'destino'
+    quando fornecido (um buffer reaproveitado). Imagens que já são BGR são retornadas como estão.
+    """
+    if isinstance(imagem, ImagemCanalUnico):
+        destino = destino_para(destino, imagem.shape, imagem.dtype)
+        if destino is None:
+            destino = np.empty(imagem.shape, dtype=imagem.dtype)
+        for canal in range(3):
+            destino[..., canal] = imagem.plano if canal == imagem.canal else 0
+        return destino
+    if imagem.ndim == 2:
+        return cv2.cvtColor(imagem, cv2.COLOR_GRAY2BGR, dst=destino_para(destino, imagem.shape + (3,), imagem.dtype))
+    return imagem
+
+def redimensionar_compacta(imagem, tamanho, interpolacao=cv2.INTER_LINEAR, destino=None):
+    """
+    Redimensiona uma imagem mantendo a forma compacta (só o plano é redimensionado).
+    """
+    if isinstance(imagem, ImagemCanalUnico):
+        plano = cv2.resize(imagem.plano, tamanho, dst=destino_para(destino, tamanho[::-1], imagem.dtype),
+                           interpolation=interpolacao)
+        return ImagemCanalUnico(plano, imagem.canal)
+    forma = tamanho[::-1] + imagem.shape[2:]
+    return cv2.resize(imagem, tamanho, dst=destino_para(destino, forma, imagem.dtype), interpolation=interpolacao)
+
+# ---------------------------------------
+# Buffers reaproveitados (sem alocações por quadro)
+# ---------------------------------------
+# Todo filtro aceita um parâmetro 'destino': um buffer onde o resultado é gravado quando tem
+# exatamente o formato do resultado. Caso contrário o filtro aloca a saída, como antes.
+# Em um laço de quadros, o resultado de um quadro serve de destino para o quadro seguinte,
+# e os buffers intermediários dos filtros ficam guardados por thread, então o laço em regime
+# (mesma resolução e mesma cadeia) não aloca nenhuma imagem nova.
+
+class PoolDeQuadros:
+    """
+    Conjunto de buffers de imagem identificados por nome e reaproveitados de um quadro para o outro.
+    """
+    def __init__(self):
+        self.buffers = {}  # Buffer mais recente de cada nome.
+
+    def buffer(self, nome, forma, dtype=np.uint8):
+        """
+        Retorna o buffer 'nome' com a forma e o tipo pedidos, realocado só quando eles mudam.
+        """
+        buffer = self.buffers.get(nome)
+        if not isinstance(buffer, np.ndarray) or buffer.shape != tuple(forma) or buffer.dtype != dtype:
+            buffer = self.buffers[nome] = np.empty(forma, dtype=dtype)
+        return buffer
+
+    def no_minimo(self, nome, tamanho, dtype=np.uint8):
+        """
+        Retorna os 'tamanho' primeiros elementos de um buffer plano que só cresce. Serve para
+        temporários de tamanhos variados (como os de cada adesivo), que assim ficam do tamanho do maior.
+        """
+        buffer = self.buffers.get(nome)
+        if not isinstance(buffer, np.ndarray) or buffer.size < tamanho or buffer.dtype != dtype:
+            buffer = self.buffers[nome] = np.empty(tamanho, dtype=dtype)
+        return buffer[:tamanho]
+
+    def reciclar(self, nome):
+        """
+        Retorna o último resultado guardado com 'nome' (ou None), para ser passado como destino.
+        O filtro só o aproveita se o formato ainda for o do novo resultado.
+        """
+        return self.buffers.get(nome)
+
+    def guardar(self, nome, resultado):
+        """
+        Guarda um resultado para ser reaproveitado como destino no próximo quadro.
+        """
+        self.buffers[nome] = resultado
+        return resultado
+
+    def limpar(self):
+        self.buffers.clear()
+
+buffers_por_thread = threading.local()  # Buffers intermediários dos filtros, um conjunto por thread.
+
+def destino_para(destino, forma, dtype=np.uint8):
+    """
+    Retorna o array onde gravar um resultado com a forma e o tipo dados: o próprio 'destino'
+    (ou o seu plano, se for uma ImagemCanalUnico) quando o formato coincide, senão None
+    (e o OpenCV aloca a saída).
+    """
+    if isinstance(destino, ImagemCanalUnico):
+        destino = destino.plano
+    if destino is not None and destino.shape == tuple(forma) and destino.dtype == dtype:
+        return destino
+    return None
+
+def pool_da_thread():
+    """
+    Retorna o PoolDeQuadros de buffers intermediários da thread atual.
+    """
+    pool = getattr(buffers_por_thread, "pool", None)
+    if pool is None:
+        pool = buffers_por_thread.pool = PoolDeQuadros()
+    return pool
+
+def buffer_temporario(nome, forma, dtype, reaproveitar):
+    """
+    Buffer intermediário de um filtro. Quando o chamador trabalha sem alocações (passou um destino),
+    o buffer é guardado e reaproveitado pela thread atual; senão é alocado e descartado depois do uso,
+    para não manter buffers de imagens grandes na memória.
+    """
+    if not reaproveitar:
+        return np.empty(forma, dtype=dtype)
+    return pool_da_thread().buffer(nome, forma, dtype)
+
+def copiar_para(imagem, destino=None):
+    """
+    Retorna uma cópia independente da imagem, gravada em 'destino' quando ele tem o formato certo.
+    """
+    plano = imagem.plano if isinstance(imagem, ImagemCanalUnico) else imagem
+    saida = destino_para(destino, plano.shape, plano.dtype)
+    if saida is None:
+        return imagem.copy()
+    np.copyto(saida, plano)
+    return ImagemCanalUnico(saida, imagem.canal) if isinstance(imagem, ImagemCanalUnico) else saida
+
+class Filtro:
+    """
+    Classe base dos filtros. Cada filtro é construído uma única vez e guarda
+    as tabelas e kernels pré-calculados, de modo que aplicá-lo não refaz nenhuma preparação.
+    """
+    def __init__(self, nome):
+        self.nome = nome  # Nome exibido na barra de filtros.
+
+    def aplicar(self, imagem, destino=None):
+        """
+        Aplica o filtro na imagem e retorna o resultado. Deve ser implementado pelas subclasses.
+        O resultado é gravado em 'destino' quando ele tem o formato do resultado (ver destino_para);
+        o destino nunca pode ser a própria imagem de entrada.
+        """
+        raise NotImplementedError
+
+    def compor(self, seguinte):
+        """
+        Retorna um único filtro equivalente a aplicar este filtro e depois o seguinte,
+        ou None quando os dois não podem ser executados em uma só passada.
+        """
+        return None
+
+    def na_qualidade(self, qualidade):
+        """
+        Retorna a versão do filtro para o nível de qualidade pedido. A maioria dos filtros
+        só tem uma versão, exata e barata, e retorna a si mesma.
+        """
+        return self
+
+    def na_escala(self, escala):
+        """
+        Retorna a versão do filtro para uma imagem reduzida pelo fator 'escala', de modo que o
+        resultado pareça o da imagem original reduzida. Só filtros de vizinhança precisam mudar.
+        """
+        return self
+
+    def em_faixas(self, altura, largura):
+        """
+        Prepara o filtro para ser aplicado em faixas horizontais de uma imagem altura x largura.
+        Retorna (filtro, halo): o filtro a aplicar em cada faixa e quantas linhas vizinhas cada
+        faixa precisa acima e abaixo para dar exatamente o mesmo resultado da imagem inteira.
+        Retorna None quando o filtro depende da imagem inteira e não pode ser dividido.
+        """
+        return None
+
+class FiltroOriginal(Filtro):
+    """
+    Filtro que não altera a imagem.
+    """
+    def aplicar(self, imagem, destino=None):
+        return copiar_para(imagem, destino)  # Retorna uma cópia para não alterar a imagem de entrada.
+
+    def compor(self, seguinte):
+        return seguinte  # Não alterar a imagem e depois aplicar outro filtro é o próprio outro filtro.
+
+    def em_faixas(self, altura, largura):
+        return self, 0  # Cada pixel só depende de si mesmo.
+
+class FiltroPontual(Filtro):
+    """
+    Filtro ponto a ponto: cada valor de pixel é trocado pelo valor de uma tabela de look-up
+    de 256 posições por canal, calculada na criação. Opcionalmente a imagem é convertida
+    para cinza antes da tabela (como fazem os mapas de cores do OpenCV).
+    Filtros pontuais seguidos podem ser compostos em uma única tabela (ver compor).
+    """
+    def __init__(self, nome, tabela, usa_cinza=False):
+        super().__init__(nome)
+        tabela = np.asarray(tabela)
+        # Aceita uma tabela única (aplicada nos três canais) ou uma tabela por canal (256x3).
+        if tabela.ndim == 1:
+            tabela = np.repeat(tabela[:, None], 3, axis=1)
+        # Garante que a tabela esteja no intervalo válido e no tipo esperado pelo cv2.LUT.
+        self.tabela = np.clip(tabela, 0, 255).astype(np.uint8)
+        self.usa_cinza = usa_cinza  # Indica se a imagem vira cinza antes da tabela.
+        # Formato 256x1x3 exigido pelo cv2.LUT para tabelas com três canais.
+        self.lut = self.tabela.reshape(256, 1, 3)
+        # Tabela de cada canal em memória contínua, para o cv2.LUT não copiar a coluna a cada chamada.
+        self.tabelas_canais = [np.ascontiguousarray(self.tabela[:, canal]) for canal in range(3)]
+        # Uma tabela identidade não precisa ser aplicada.
+        self.identidade = bool(np.array_equal(self.tabela, np.repeat(valores_pixel[:, None], 3, axis=1)))
+        # Forma do resultado quando a entrada é cinza: 'cinza' (três canais iguais),
+        # 'canal_unico' (dois canais zerados) ou 'cores'.
+        canais_nao_nulos = [canal for canal in range(3) if self.tabela[:, canal].any()]
+        if np.array_equal(self.tabela[:, 0], self.tabela[:, 1]) and np.array_equal(self.tabela[:, 0], self.tabela[:, 2]):
+            self.forma = "cinza"
+        elif len(canais_nao_nulos) == 1:
+            self.forma = "canal_unico"
+            self.canal = canais_nao_nulos[0]
+        else:
+            self.forma = "cores"
+
+    def compor(self, seguinte):
+        nome = f"{self.nome} + {seguinte.nome}"
+        if isinstance(seguinte, FiltroOriginal):
+            return self  # O filtro original não altera nada.
+        if self.usa_cinza and isinstance(seguinte, (FiltroPontual, FiltroMatrizCor, FiltroLUT3D)):
+            # Depois da conversão para cinza, cada pixel depende de um único valor (0 a 255).
+            # Aplicar o filtro seguinte às 256 cores da tabela dá exatamente a nova tabela.
+            tabela = expandir_para_bgr(seguinte.aplicar(self.tabela.reshape(256, 1, 3))).reshape(256, 3)
+            return FiltroPontual(nome, tabela, usa_cinza=True)
+        if isinstance(seguinte, FiltroPontual) and not seguinte.usa_cinza:
+            # A tabela composta é seguinte[atual[v]] em cada canal.
+            tabela = np.take_along_axis(seguinte.tabela, self.tabela.astype(np.intp), axis=0)
+            return FiltroPontual(nome, tabela, self.usa_cinza)
+        if isinstance(seguinte, FiltroMatrizCor):
+            # A tabela passa a ser aplicada pela própria matriz antes da transformação.
+            return seguinte.com_tabelas(nome, tabela_antes=self)
+        if isinstance(seguinte, FiltroLUT3D) and not self.usa_cinza:
+            # Cada canal passa pela tabela antes de indexar a LUT 3D: basta reindexar os eixos da LUT.
+            return seguinte.com_tabela_antes(nome, self)
+        # O seguinte precisa da imagem em cinza, que depende dos três canais já transformados.
+        return None
+
+    def em_faixas(self, altura, largura):
+        return self, 0  # Cada pixel só depende de si mesmo.
+
+    def aplicar(self, imagem, destino=None):
+        if isinstance(imagem, ImagemCanalUnico):
+            imagem = expandir_para_bgr(imagem)  # As tabelas podem misturar o canal com os zerados.
+        if imagem.ndim == 2:
+            # Uma entrada em cinza tem os três canais iguais: basta consultar a tabela pelo valor de cinza.
+            return self.aplicar_em_cinza(imagem, destino)
+        if self.usa_cinza:
+            if self.forma == "cores":
+                # O cinza é só um passo intermediário antes de voltar para três canais.
+                cinza = buffer_temporario("cinza", imagem.shape[:2], np.uint8, destino is not None)
+                return self.aplicar_em_cinza(cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY, dst=cinza), destino)
+            # O resultado tem um plano só: converte direto no destino e aplica a tabela nele mesmo.
+            cinza = cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY, dst=destino_para(destino, imagem.shape[:2]))
+            return self.aplicar_em_cinza(cinza, cinza)
+        if self.identidade:
+            return copiar_para(imagem, destino)  # Nada a fazer além de devolver uma cópia independente.
+        return cv2.LUT(imagem, self.lut, dst=destino_para(destino, imagem.shape))  # Uma única passada sobre a imagem.
+
+    def aplicar_em_cinza(self, cinza, destino=None):
+        """
+        Aplica a tabela a uma imagem em cinza, devolvendo a forma mais compacta do resultado.
+        'destino' pode ser o próprio plano de cinza, quando ele pertence ao filtro (tabela aplicada no lugar).
+        """
+        forma = cinza.shape
+        if self.forma == "cinza":
+            if self.identidade:
+                return cinza if destino is cinza else copiar_para(cinza, destino)
+            return cv2.LUT(cinza, self.tabelas_canais[0], dst=destino_para(destino, forma))  # Resultado de um canal só.
+        if self.forma == "canal_unico":
+            plano = cv2.LUT(cinza, self.tabelas_canais[self.canal], dst=destino_para(destino, forma))
+            return ImagemCanalUnico(plano, self.canal)
+        # Volta para três canais, como faz o cv2.applyColorMap, e aplica a tabela no mesmo buffer.
+        resultado = cv2.cvtColor(cinza, cv2.COLOR_GRAY2BGR, dst=destino_para(destino, forma + (3,)))
+        cv2.LUT(resultado, self.lut, dst=resultado)
+        return resultado
+
+def fundir_filtros(filtros):
+    """
+    Junta filtros vizinhos que podem ser executados em uma só passada (tabelas e matrizes de cor).
+    Uma sequência de filtros pontuais sem conversões para cinza no meio vira uma única
+    passada de cv2.LUT; filtros de vizinhança (desfoque, bilateral) continuam separados.
+    """
+    fundidos = []
+    for filtro in filtros:
+        # Tenta juntar o filtro atual ao último filtro já fundido.
+        if fundidos:
+            junto = fundidos[-1].compor(filtro)
+            if junto is not None:
+                fundidos[-1] = junto
+                continue
+        fundidos.append(filtro)  # Não dá para juntar: começa uma nova etapa.
+    return fundidos
+
+def tabela_mapa_de_cores(mapa):
+    """
+    Extrai a tabela 256x3 de um mapa de cores do OpenCV aplicando-o a uma rampa de cinza.
+    """
+    rampa = valores_pixel.astype(np.uint8).reshape(256, 1)
+    return cv2.applyColorMap(rampa, mapa).reshape(256, 3)
+
+# Maior raio em que o desfoque gaussiano separável ainda é o algoritmo mais barato.
+RAIO_MAXIMO_GAUSSIANO = 10
+# A partir desse número de pixels, desfoques grandes são feitos em uma pirâmide reduzida.
+LIMIAR_PIXELS_PIRAMIDE = 2_000_000
+# Menor sigma residual aceito no nível mais reduzido da pirâmide (abaixo disso a imagem serrilha).
+SIGMA_MINIMO_PIRAMIDE = 2.0
+# Número de passadas de média (caixa) usadas para aproximar o gaussiano.
+PASSADAS_CAIXA = 3
+
+def sigma_do_raio(raio):
+    """
+    Sigma que o OpenCV usa para um kernel gaussiano de raio dado (tamanho 2 * raio + 1).
+    """
+    return 0.3 * (raio - 1) + 0.8
+
+def larguras_caixas(sigma, passadas=PASSADAS_CAIXA):
+    """
+    Larguras ímpares de caixas cujas médias sucessivas aproximam um gaussiano de sigma dado.
+    """
+    ideal = np.sqrt(12 * sigma * sigma / passadas + 1)  # Largura ideal, se todas fossem iguais.
+    menor = int(ideal)
+    if menor % 2 == 0:
+        menor -= 1  # As caixas precisam ter largura ímpar para ficarem centradas.
+    maior = menor + 2
+    # Quantas caixas usam a largura menor para que a variância total bata com sigma².
+    quantidade_menor = round((12 * sigma * sigma - passadas * menor * menor - 4 * passadas * menor - 3 * passadas)
+                             / (-4 * menor - 4))
+    return [menor if i < quantidade_menor else maior for i in range(passadas)]
+
+class FiltroDesfoque(Filtro):
+    """
+    Desfoque gaussiano com intensidade ajustável (raio do kernel). O algoritmo é escolhido
+    pelo raio e pela resolução: gaussiano separável para raios pequenos, médias (caixas)
+    repetidas para raios grandes, e pirâmide reduzida para raios grandes em imagens grandes.
+    Assim o custo de um desfoque forte fica próximo do custo de um desfoque fraco.
+    """
+    def __init__(self, nome, raio, algoritmo=None):
+        super().__init__(nome)
+        self.raio = raio                     # Raio do kernel (tamanho 2 * raio + 1).
+        self.algoritmo = algoritmo           # Algoritmo fixo; None escolhe pela resolução da imagem.
+        self.sigma = sigma_do_raio(raio)     # Intensidade equivalente do gaussiano.
+        self.tamanho_kernel = (2 * raio + 1, 2 * raio + 1)
+        # Caixas equivalentes, calculadas uma única vez.
+        self.caixas = [(largura, largura) for largura in larguras_caixas(self.sigma)]
+
+    def niveis_piramide(self, altura, largura):
+        """
+        Quantos níveis de redução podem ser usados sem que o sigma residual fique pequeno demais.
+        """
+        if altura * largura < LIMIAR_PIXELS_PIRAMIDE:
+            return 0
+        niveis = 0
+        # Cada nível reduz pela metade; o sigma que sobra é medido em pixels do nível reduzido.
+        while self.sigma_residual(niveis + 1) >= SIGMA_MINIMO_PIRAMIDE and min(altura, largura) >> (niveis + 1) >= 16:
+            niveis += 1
+        return niveis
+
+    def sigma_residual(self, niveis):
+        """
+        Sigma que ainda falta aplicar depois de reduzir a imagem 'niveis' vezes com cv2.pyrDown e
+        ampliar de volta o mesmo número de vezes com cv2.pyrUp. Cada redução e cada ampliação
+        desfocam com sigma de aproximadamente 1 pixel do nível maior.
+        """
+        variancia_piramide = 2 * sum((2 ** nivel) ** 2 for nivel in range(niveis))
+        variancia_restante = self.sigma * self.sigma - variancia_piramide
+        if variancia_restante <= 0:
+            return 0.0
+        return np.sqrt(variancia_restante) / (2 ** niveis)
+
+    def escolher_algoritmo(self, altura, largura):
+        """
+        Retorna 'gaussiano', 'caixas' ou 'piramide', conforme o mais barato para o raio e a resolução.
+        """
+        if self.raio <= RAIO_MAXIMO_GAUSSIANO:
+            return "gaussiano"
+        if self.niveis_piramide(altura, largura) > 0:
+            return "piramide"
+        return "caixas"
+
+    def na_escala(self, escala):
+        if escala == 1.0:
+            return self
+        # O raio acompanha a escala para que o desfoque cubra a mesma parte da cena.
+        return FiltroDesfoque(self.nome, max(0, round(self.raio * escala)), self.algoritmo)
+
+    def em_faixas(self, altura, largura):
+        # O algoritmo é escolhido pela imagem inteira, e não pelo tamanho de cada faixa.
+        algoritmo = self.algoritmo or self.escolher_algoritmo(altura, largura)
+        if algoritmo == "gaussiano":
+            return FiltroDesfoque(self.nome, self.raio, algoritmo), self.raio
+        if algoritmo == "caixas":
+            # Cada passada de média espalha a influência de um pixel pelo raio da sua caixa.
+            return FiltroDesfoque(self.nome, self.raio, algoritmo), sum(largura_caixa // 2 for largura_caixa, _ in self.caixas)
+        return None  # A pirâmide depende do alinhamento das reduções na imagem inteira.
+
+    def aplicar(self, imagem, destino=None):
+        if isinstance(imagem, ImagemCanalUnico):
+            # O desfoque é linear e mantém os canais zerados em zero: basta desfocar o plano.
+            return ImagemCanalUnico(self.aplicar(imagem.plano, destino), imagem.canal)
+        altura, largura = imagem.shape[:2]
+        algoritmo = self.algoritmo or self.escolher_algoritmo(altura, largura)
+        saida = destino_para(destino, imagem.shape, imagem.dtype)
+        if algoritmo == "gaussiano":
+            return cv2.GaussianBlur(imagem, self.tamanho_kernel, 0, dst=saida)  # Sigma calculado pelo OpenCV.
+        if algoritmo == "caixas":
+            return self.aplicar_caixas(imagem, self.caixas, saida)
+        return self.aplicar_piramide(imagem, saida, reaproveitar=destino is not None)
+
+    def aplicar_caixas(self, imagem, caixas, destino=None):
+        """
+        Médias repetidas: o custo de cada passada não depende do tamanho da caixa.
+        """
+        resultado = cv2.blur(imagem, caixas[0], dst=destino)
+        for caixa in caixas[1:]:
+            cv2.blur(resultado, caixa, dst=resultado)  # As passadas seguintes reaproveitam o buffer.
+        return resultado
+
+    def aplicar_piramide(self, imagem, destino=None, reaproveitar=False):
+        """
+        Reduz a imagem, desfoca o nível pequeno com o sigma que falta e amplia de volta, nível a nível.
+        """
+        altura, largura = imagem.shape[:2]
+        niveis = self.niveis_piramide(altura, largura)
+        if niveis == 0:
+            return self.aplicar_caixas(imagem, self.caixas, destino)  # Imagem pequena demais para reduzir.
+        reduzida = imagem
+        formas = []
+        for nivel in range(niveis):
+            formas.append(reduzida.shape)
+            # Cada redução já aplica um pequeno gaussiano; o nível tem metade do tamanho, arredondado para cima.
+            forma = ((reduzida.shape[0] + 1) // 2, (reduzida.shape[1] + 1) // 2) + imagem.shape[2:]
+            reduzida = cv2.pyrDown(reduzida, dst=buffer_temporario(("piramide", nivel), forma, imagem.dtype, reaproveitar))
+        sigma = self.sigma_residual(niveis)
+        caixas = [(largura_caixa, largura_caixa) for largura_caixa in larguras_caixas(sigma)]
+        # O nível reduzido pertence ao filtro, então as médias podem ser feitas nele mesmo.
+        reduzida = self.aplicar_caixas(reduzida, caixas, reduzida)
+        # A ampliação usa cv2.pyrUp, que põe cada pixel do nível sobre a amostra par de onde o cv2.pyrDown
+        # o tirou. Um cv2.resize direto centraria os pixels de outro jeito e deslocaria a imagem
+        # em (2^niveis - 1) / 2 pixels para baixo e para a direita.
+        for nivel in reversed(range(niveis)):
+            forma = formas[nivel]
+            saida = destino if nivel == 0 else buffer_temporario(("piramide_subida", nivel), forma, imagem.dtype, reaproveitar)
+            reduzida = cv2.pyrUp(reduzida, dst=saida, dstsize=(forma[1], forma[0]))
+        return reduzida
+
+# Bits da parte fracionária dos coeficientes das matrizes de cor. Para imagens uint8 de três canais,
+# o cv2.transform usa um kernel inteiro de ponto fixo com exatamente essa precisão (10 bits),
+# desde que os coeficientes fiquem abaixo de 32 em módulo e os deslocamentos abaixo de 8192.
+BITS_MATRIZ = 10
+ESCALA_MATRIZ = 1 << BITS_MATRIZ
+LIMITE_COEFICIENTE = 32 * ESCALA_MATRIZ
+LIMITE_DESLOCAMENTO = 8192 * ESCALA_MATRIZ
+
+class FiltroMatrizCor(Filtro):
+    """
+    Aplica uma matriz 3x3 de transformação de cores (com deslocamento opcional por canal)
+    em aritmética inteira de ponto fixo, saturando direto em uint8, sem imagens em float.
+    Os coeficientes são arredondados uma única vez na criação para múltiplos de 1/1024.
+    Pode carregar tabelas pontuais a serem aplicadas antes e depois da matriz,
+    para que filtros pontuais vizinhos rodem na mesma etapa.
+    """
+    def __init__(self, nome, matriz, deslocamento=(0, 0, 0), tabela_antes=None, tabela_depois=None):
+        super().__init__(nome)
+        matriz = np.asarray(matriz, dtype=np.float64)
+        # Uma matriz 3x4 já traz o deslocamento na última coluna.
+        if matriz.shape == (3, 4):
+            matriz, deslocamento = matriz[:, :3], matriz[:, 3]
+        if matriz.shape != (3, 3):
+            raise ValueError(f"A matriz de cor deve ser 3x3 ou 3x4, recebida {matriz.shape}.")
+        # Converte os coeficientes e deslocamentos para inteiros de ponto fixo.
+        self.coeficientes = np.round(matriz * ESCALA_MATRIZ).astype(np.int32)
+        self.deslocamento = np.round(np.asarray(deslocamento, dtype=np.float64) * ESCALA_MATRIZ).astype(np.int32)
+        # Fora desses limites o OpenCV abandona o caminho inteiro e volta a calcular em float.
+        if np.abs(self.coeficientes).max() >= LIMITE_COEFICIENTE or np.abs(self.deslocamento).max() >= LIMITE_DESLOCAMENTO:
+            raise ValueError("Coeficientes da matriz de cor fora do intervalo do kernel inteiro.")
+        # Matriz 3x4 com os valores já quantizados (múltiplos exatos de 1/1024), no formato do cv2.transform.
+        self.matriz = np.hstack([self.coeficientes, self.deslocamento[:, None]]) / ESCALA_MATRIZ
+        self.tabela_antes = tabela_antes    # Filtro pontual (sem cinza) aplicado antes da matriz.
+        self.tabela_depois = tabela_depois  # Filtro pontual (sem cinza) aplicado depois da matriz.
+
+    def com_tabelas(self, nome, tabela_antes=None, tabela_depois=None):
+        """
+        Retorna uma cópia da matriz com mais tabelas compostas antes e/ou depois dela.
+        """
+        if tabela_antes is None:
+            tabela_antes = self.tabela_antes
+        elif self.tabela_antes is not None:
+            tabela_antes = tabela_antes.compor(self.tabela_antes)
+        if tabela_depois is None:
+            tabela_depois = self.tabela_depois
+        elif self.tabela_depois is not None:
+            tabela_depois = self.tabela_depois.compor(tabela_depois)
+        return FiltroMatrizCor(nome, self.matriz, tabela_antes=tabela_antes, tabela_depois=tabela_depois)
+
+    def compor(self, seguinte):
+        if isinstance(seguinte, FiltroOriginal):
+            return self  # O filtro original não altera nada.
+        if isinstance(seguinte, FiltroPontual) and not seguinte.usa_cinza:
+            return self.com_tabelas(f"{self.nome} + {seguinte.nome}", tabela_depois=seguinte)
+        return None
+
+    def em_faixas(self, altura, largura):
+        return self, 0  # Cada pixel só depende de si mesmo.
+
+    def aplicar(self, imagem, destino=None):
+        imagem = expandir_para_bgr(imagem)  # A matriz mistura os três canais.
+        if self.tabela_antes is not None:
+            # Tabela composta antes da matriz, gravada em um buffer intermediário.
+            intermediaria = buffer_temporario("matriz", imagem.shape, imagem.dtype, destino is not None)
+            imagem = self.tabela_antes.aplicar(imagem, intermediaria)
+        # Para uint8 o resultado já sai saturado em 0..255, calculado no kernel inteiro do OpenCV.
+        resultado = cv2.transform(imagem, self.matriz, dst=destino_para(destino, imagem.shape, imagem.dtype))
+        if self.tabela_depois is not None:
+            # A tabela de saída é aplicada no próprio resultado, sem outra cópia.
+            cv2.LUT(resultado, self.tabela_depois.lut, dst=resultado)
+        return resultado
+
+# ---------------------------------------
+# LUTs 3D de gradação de cor (.cube)
+# ---------------------------------------
+
+PASTA_LUTS = "luts"  # Arquivos .cube nesta pasta viram filtros na barra.
+# Abaixo desse número de pixels, a interpolação direta na grade sai mais barata do que montar a tabela completa.
+LIMIAR_PIXELS_TABELA_LUT = 256 * 256
+
+def ler_arquivo_cube(caminho):
+    """
+    Lê um arquivo .cube (formato Adobe/Resolve) de LUT 3D.
+    Retorna (título, grade, domínio mínimo, domínio máximo): a grade N x N x N x 3 é indexada
+    por [azul, verde, vermelho], com as cores de saída em BGR e valores de 0 a 1; os domínios vêm em BGR.
+    """
+    titulo = None
+    tamanho = None
+    dominio_min = [0.0, 0.0, 0.0]
+    dominio_max = [1.0, 1.0, 1.0]
+    valores = []
+    with open(caminho, encoding="utf-8", errors="replace") as arquivo:
+        for linha in arquivo:
+            linha = linha.split("#")[0].strip()  # Ignora comentários e linhas vazias.
+            if not linha:
+                continue
+            campos = linha.split()
+            chave = campos[0].upper()
+            if chave == "TITLE":
+                titulo = linha[len(campos[0]):].strip().strip('"')
+            elif chave == "LUT_3D_SIZE":
+                tamanho = int(campos[1])
+            elif chave == "DOMAIN_MIN":
+                dominio_min = [float(valor) for valor in campos[1:4]]
+            elif chave == "DOMAIN_MAX":
+                dominio_max = [float(valor) for valor in campos[1:4]]
+            elif chave == "LUT_1D_SIZE":
+                raise ValueError("LUTs 1D não são suportadas; use um filtro pontual.")
+            elif chave[0].isdigit() or chave[0] in "+-.":
+                valores.append([float(valor) for valor in campos[:3]])
+            # Outras palavras-chave (LUT_3D_INPUT_RANGE etc.) são ignoradas.
+    if tamanho is None or tamanho < 2:
+        raise ValueError(f"{caminho}: tamanho da LUT 3D ausente ou inválido.")
+    if len(valores) != tamanho ** 3:
+        raise ValueError(f"{caminho}: esperados {tamanho ** 3} valores, encontrados {len(valores)}.")
+    # No arquivo o vermelho varia mais rápido, depois o verde e por último o azul: a ordem C de [azul][verde][vermelho].
+    grade = np.asarray(valores, dtype=np.float32).reshape(tamanho, tamanho, tamanho, 3)[..., ::-1]
+    return titulo, np.ascontiguousarray(grade), dominio_min[::-1], dominio_max[::-1]
+
+def carregar_lut_cube(caminho):
+    """
+    Cria o filtro de uma LUT 3D. A grade lida do texto é guardada ao lado do arquivo em uma forma
+    binária compacta (.lut.npz, valores de 16 bits), reaproveitada enquanto o .cube não mudar.
+    O filtro é sempre criado a partir da grade de 16 bits, para que o resultado seja o mesmo
+    lendo o texto ou a forma binária (e mesmo que a forma binária não possa ser gravada).
+    """
+    caminho_binario = os.path.splitext(caminho)[0] + ".lut.npz"
+    if os.path.exists(caminho_binario) and os.path.getmtime(caminho_binario) >= os.path.getmtime(caminho):
+        with np.load(caminho_binario) as dados:
+            titulo = str(dados["titulo"])
+            grade_16_bits = dados["grade"]
+            dominio_min, dominio_max = dados["dominio_min"], dados["dominio_max"]
+    else:
+        titulo, grade, dominio_min, dominio_max = ler_arquivo_cube(caminho)
+        grade_16_bits = np.round(np.clip(grade, 0, 1) * 65535).astype(np.uint16)
+        try:
+            np.savez(caminho_binario, titulo=titulo or "", dominio_min=dominio_min, dominio_max=dominio_max,
+                     grade=grade_16_bits)
+        except OSError as erro:
+            print(f"Aviso: não foi possível guardar a LUT compilada em {caminho_binario}: {erro}")
+    grade = grade_16_bits.astype(np.float32) / 65535
+    nome = titulo or os.path.splitext(os.path.basename(caminho))[0]
+    return FiltroLUT3D(nome, grade, dominio_min, dominio_max)
+
+class FiltroLUT3D(Filtro):
+    """
+    Gradação de cor por uma LUT 3D: cada cor de entrada é trocada pela cor interpolada
+    (trilinearmente) em uma grade N x N x N. Os índices e pesos de interpolação de cada valor
+    de 0 a 255 são calculados na criação. Na primeira aplicação em uma imagem grande, a grade é
+    expandida em uma tabela completa de 256 x 256 x 256 cores (64 MB, BGRA em inteiros de 32 bits),
+    e daí em diante cada pixel custa uma única consulta, qualquer que tenha sido a gradação original.
+    Filtros de cor ponto a ponto vizinhos podem ser compostos na própria tabela (ver compor).
+    """
+    def __init__(self, nome, grade=None, dominio_min=(0, 0, 0), dominio_max=(1, 1, 1), tabela=None):
+        super().__init__(nome)
+        self.tabela = tabela            # Tabela completa (256 x 256 x 256, uint32 BGRA), montada sob demanda.
+        self.trava = threading.Lock()   # Impede que duas threads montem a mesma tabela ao mesmo tempo.
+        if grade is None:
+            return  # Filtro criado direto de uma tabela completa (composição).
+        tamanho = grade.shape[0]
+        self.grade = grade.astype(np.float32) * 255  # Valores da grade já na escala de saída (0 a 255).
+        # Posição de cada valor de entrada na grade, por canal: índice inferior e peso do vizinho superior.
+        self.indices = []
+        self.pesos = []
+        for canal in range(3):
+            posicao = (valores_pixel / 255 - dominio_min[canal]) / (dominio_max[canal] - dominio_min[canal])
+            posicao = np.clip(posicao, 0, 1) * (tamanho - 1)
+            inferior = np.minimum(posicao.astype(np.intp), tamanho - 2)
+            self.indices.append(inferior)
+            self.pesos.append((posicao - inferior).astype(np.float32))
+
+    def interpolar(self, azul, verde, vermelho):
+        """
+        Interpolação trilinear separável: primeiro ao longo do vermelho, depois do verde e por fim do azul.
+        Recebe os valores de entrada de cada canal (arrays de mesma forma ou intervalos a combinar
+        por broadcasting) e retorna as cores BGR em float32, na escala de 0 a 255.
+        """
+        grade = self.grade
+        ib, ig, ir = self.indices[0][azul], self.indices[1][verde], self.indices[2][vermelho]
+        pb, pg, pr = self.pesos[0][azul][..., None], self.pesos[1][verde][..., None], self.pesos[2][vermelho][..., None]
+
+        def ao_longo_do_vermelho(b, g):
+            return grade[b, g, ir] * (1 - pr) + grade[b, g, ir + 1] * pr
+
+        def ao_longo_do_verde(b):
+            return ao_longo_do_vermelho(b, ig) * (1 - pg) + ao_longo_do_vermelho(b, ig + 1) * pg
+
+        return ao_longo_do_verde(ib) * (1 - pb) + ao_longo_do_verde(ib + 1) * pb
+
+    def obter_tabela(self):
+        """
+        Retorna a tabela completa, montando-a na primeira chamada. A interpolação é feita eixo a eixo
+        sobre a grade inteira (mesmas contas de interpolar), e o último eixo uma fatia de azul por vez,
+        para não manter 256³ cores em float na memória.
+        """
+        with self.trava:
+            if self.tabela is None:
+                ib, ig, ir = self.indices
+                pb, pg, pr = (peso[:, None] for peso in self.pesos)
+                # Ao longo do vermelho: N x N x 256 cores; depois do verde: N x 256 x 256 cores.
+                grade = self.grade[:, :, ir] * (1 - pr) + self.grade[:, :, ir + 1] * pr
+                grade = grade[:, ig] * (1 - pg[:, None]) + grade[:, ig + 1] * pg[:, None]
+                tabela = np.zeros((256, 256, 256, 4), dtype=np.uint8)
+                for azul in range(256):
+                    cores = grade[ib[azul]] * (1 - pb[azul]) + grade[ib[azul] + 1] * pb[azul]
+                    tabela[azul, ..., :3] = np.clip(np.rint(cores), 0, 255)
+                self.tabela = tabela.view(np.uint32).reshape(256 * 256 * 256)
+            return self.tabela
+
+    def tabela_como_imagem(self):
+        """
+        A tabela completa como uma imagem BGR de 4096 x 4096 pixels, para aplicar outros filtros nela.
+        """
+        return cv2.cvtColor(self.obter_tabela().view(np.uint8).reshape(4096, 4096, 4), cv2.COLOR_BGRA2BGR)
+
+    def com_tabela_antes(self, nome, pontual):
+        """
+        Retorna a LUT que aplica o filtro pontual (sem cinza) antes desta: T'[b, g, r] = T[tb[b], tg[g], tr[r]].
+        """
+        tabela = self.obter_tabela().reshape(256, 256, 256)
+        azul, verde, vermelho = (pontual.tabela[:, canal].astype(np.intp) for canal in range(3))
+        tabela = tabela[azul][:, verde][:, :, vermelho]
+        return FiltroLUT3D(nome, tabela=np.ascontiguousarray(tabela).reshape(-1))
+
+    def compor(self, seguinte):
+        if isinstance(seguinte, FiltroOriginal):
+            return self  # O filtro original não altera nada.
+        if isinstance(seguinte, (FiltroMatrizCor, FiltroLUT3D)) or (isinstance(seguinte, FiltroPontual) and not seguinte.usa_cinza):
+            # O filtro seguinte só depende da cor de cada pixel: aplicá-lo às 256³ cores da tabela dá a nova tabela.
+            cores = expandir_para_bgr(seguinte.aplicar(self.tabela_como_imagem()))
+            tabela = cv2.cvtColor(cores, cv2.COLOR_BGR2BGRA).view(np.uint32).reshape(-1)
+            return FiltroLUT3D(f"{self.nome} + {seguinte.nome}", tabela=tabela)
+        return None
+
+    def em_faixas(self, altura, largura):
+        return self, 0  # Cada pixel só depende de si mesmo.
+
+    def aplicar(self, imagem, destino=None):
+        imagem = expandir_para_bgr(imagem)  # A LUT mistura os três canais.
+        altura, largura = imagem.shape[:2]
+        saida = destino_para(destino, imagem.shape, imagem.dtype)
+        if self.tabela is None and altura * largura < LIMIAR_PIXELS_TABELA_LUT:
+            # Imagem pequena (miniaturas): interpola direto na grade, sem montar a tabela completa.
+            cores = self.interpolar(imagem[..., 0], imagem[..., 1], imagem[..., 2])
+            if saida is None:
+                saida = np.empty(imagem.shape, dtype=np.uint8)
+            np.copyto(saida, np.clip(np.rint(cores), 0, 255), casting="unsafe")
+            return saida
+        reaproveitar = destino is not None
+        # Índice de cada pixel na tabela: (azul << 16) | (verde << 8) | vermelho.
+        indice = buffer_temporario(("lut3d", "indice"), (altura, largura), np.uint32, reaproveitar)
+        np.copyto(indice, imagem[..., 0])
+        np.left_shift(indice, 8, out=indice)
+        np.bitwise_or(indice, imagem[..., 1], out=indice)
+        np.left_shift(indice, 8, out=indice)
+        np.bitwise_or(indice, imagem[..., 2], out=indice)
+        # Uma única consulta por pixel traz as três cores juntas (BGRA em 32 bits).
+        cores = np.take(self.obter_tabela(), indice, out=buffer_temporario(("lut3d", "cores"), (altura, largura), np.uint32, reaproveitar))
+        return cv2.cvtColor(cores.view(np.uint8).reshape(altura, largura, 4), cv2.COLOR_BGRA2BGR, dst=saida)
+
+# Menor lado, em pixels, da imagem reduzida usada pela versão rápida do filtro bilateral.
+LADO_REDUZIDO_BILATERAL = 360
+# Fração do sigma de cor usada como regularização (eps) do filtro guiado; ajustada para
+# aproximar o resultado do cv2.bilateralFilter com os parâmetros do Kyle+Kendall Slim.
+FATOR_EPS_GUIADO = 0.3
+
+class FiltroBilateral(Filtro):
+    """
+    Aplica o filtro bilateral, que suaviza preservando as bordas.
+    Na qualidade rápida, usa um filtro guiado calculado em resolução reduzida, com os
+    coeficientes ampliados e aplicados sobre a imagem em resolução cheia, o que mantém as bordas nítidas.
+    """
+    def __init__(self, nome, diametro, sigma_cor, sigma_espaco, qualidade=QUALIDADE_EXATA):
+        super().__init__(nome)
+        self.diametro = diametro          # Diâmetro da vizinhança de cada pixel.
+        self.sigma_cor = sigma_cor        # Quanto cores diferentes se misturam.
+        self.sigma_espaco = sigma_espaco  # Quanto pixels distantes se influenciam.
+        self.qualidade = qualidade        # Nível de qualidade desta versão do filtro.
+        self.versoes = {qualidade: self}  # Versões do mesmo filtro em cada qualidade, criadas uma única vez.
+        # Regularização do filtro guiado, na escala de 0 a 255 da imagem.
+        self.eps = (FATOR_EPS_GUIADO * sigma_cor) ** 2
+
+    def na_qualidade(self, qualidade):
+        if qualidade not in self.versoes:
+            versao = FiltroBilateral(self.nome, self.diametro, self.sigma_cor, self.sigma_espaco, qualidade)
+            versao.versoes = self.versoes  # Todas as versões compartilham o mesmo dicionário.
+            self.versoes[qualidade] = versao
+        return self.versoes[qualidade]
+
+    def na_escala(self, escala):
+        if escala == 1.0:
+            return self
+        # A vizinhança e o sigma espacial acompanham a escala; o sigma de cor não depende dela.
+        return FiltroBilateral(self.nome, max(1, round(self.diametro * escala)), self.sigma_cor,
+                               self.sigma_espaco * escala, self.qualidade)
+
+    def em_faixas(self, altura, largura):
+        if self.qualidade == QUALIDADE_RAPIDA:
+            return None  # A versão rápida reduz a imagem inteira de uma vez.
+        # Com diâmetro não positivo, o OpenCV calcula o raio a partir do sigma espacial.
+        raio = self.diametro // 2 if self.diametro > 0 else round(self.sigma_espaco * 1.5)
+        return self, raio
+
+    def aplicar(self, imagem, destino=None):
+        if isinstance(imagem, ImagemCanalUnico):
+            # Com dois canais zerados, a distância de cor é a do único canal: basta filtrar o plano.
+            return ImagemCanalUnico(self.filtrar(imagem.plano, self.sigma_cor, destino), imagem.canal)
+        if imagem.ndim == 2:
+            # Cinza equivale a três canais iguais. Como o OpenCV soma a diferença dos três canais,
+            # filtrar o plano único com um terço do sigma de cor dá os mesmos pesos.
+            return self.filtrar(imagem, self.sigma_cor / 3, destino)
+        return self.filtrar(imagem, self.sigma_cor, destino)
+
+    def filtrar(self, imagem, sigma_cor, destino=None):
+        """
+        Aplica a versão exata ou a rápida do filtro em uma imagem de um ou três canais.
+        """
+        if self.qualidade == QUALIDADE_RAPIDA:
+            # O filtro guiado trata cada canal separadamente, então o sigma de cor não muda.
+            return self.aplicar_rapido(imagem, destino)
+        return cv2.bilateralFilter(imagem, self.diametro, sigma_cor, self.sigma_espaco,
+                                   dst=destino_para(destino, imagem.shape, imagem.dtype))
+
+    def aplicar_rapido(self, imagem, destino=None):
+        """
+        Filtro guiado rápido (He e Sun, 2015): a média e a variância locais são calculadas na
+        imagem reduzida e o resultado é a * imagem + b, com a e b ampliados para a resolução cheia.
+        Todos os passos gravam em buffers intermediários, reaproveitados quando há um destino.
+        """
+        reaproveitar = destino is not None
+        altura, largura = imagem.shape[:2]
+        canais = imagem.shape[2:]
+        # Fator de redução que deixa o menor lado perto de LADO_REDUZIDO_BILATERAL.
+        fator = max(1, min(altura, largura) // LADO_REDUZIDO_BILATERAL)
+        tamanho_reduzido = (max(1, largura // fator), max(1, altura // fator))
+        forma_reduzida = tamanho_reduzido[::-1] + canais
+        forma_cheia = (altura, largura) + canais
+
+        def temporario(nome, forma):
+            return buffer_temporario(("guiado", nome), forma, np.float32, reaproveitar)
+
+        reduzida_8 = cv2.resize(imagem, tamanho_reduzido, interpolation=cv2.INTER_AREA,
+                                dst=buffer_temporario(("guiado", "reduzida_8"), forma_reduzida, np.uint8, reaproveitar))
+        reduzida = temporario("reduzida", forma_reduzida)
+        np.copyto(reduzida, reduzida_8)
+        # Raio da janela na imagem reduzida, equivalente ao raio do filtro bilateral original.
+        raio = max(1, round((self.diametro // 2) / fator))
+        janela = (2 * raio + 1, 2 * raio + 1)
+
+        # Média e variância locais de cada canal.
+        media = cv2.boxFilter(reduzida, -1, janela, dst=temporario("media", forma_reduzida))
+        quadrados = np.multiply(reduzida, reduzida, out=temporario("quadrados", forma_reduzida))
+        media_quadrados = cv2.boxFilter(quadrados, -1, janela, dst=temporario("media_quadrados", forma_reduzida))
+        variancia = np.multiply(media, media, out=quadrados)  # O buffer dos quadrados não é mais usado.
+        np.subtract(media_quadrados, variancia, out=variancia)
+        # Onde a variância é alta (bordas), a ~ 1 e o pixel é preservado; em áreas lisas, a ~ 0 e vira a média.
+        a = np.add(variancia, self.eps, out=media_quadrados)
+        np.divide(variancia, a, out=a)
+        b = np.multiply(a, media, out=variancia)
+        np.subtract(media, b, out=b)
+        # Suaviza os coeficientes e os amplia para a resolução original.
+        a = cv2.resize(cv2.boxFilter(a, -1, janela, dst=temporario("a_suave", forma_reduzida)), (largura, altura),
+                       dst=temporario("a", forma_cheia))
+        b = cv2.resize(cv2.boxFilter(b, -1, janela, dst=temporario("b_suave", forma_reduzida)), (largura, altura),
+                       dst=temporario("b", forma_cheia))
+
+        # Resultado = a * imagem + b, reaproveitando o buffer de a.
+        np.multiply(a, imagem, out=a)
+        a += b
+        # Arredonda e satura de volta para uint8.
+        return cv2.convertScaleAbs(a, dst=destino_para(destino, forma_cheia, np.uint8))
+
+class CadeiaDeFiltros(Filtro):
+    """
+    Sequência ordenada de filtros aplicados um após o outro (por exemplo, sépia, desfoque e brilho).
+    Na criação, filtros vizinhos que podem rodar juntos são fundidos em uma única etapa,
+    e só os filtros de vizinhança exigem passadas separadas sobre a imagem.
+    """
+    def __init__(self, filtros, nome=None):
+        self.filtros = list(filtros)  # Filtros na ordem escolhida pelo usuário.
+        super().__init__(nome or " + ".join(filtro.nome for filtro in self.filtros))
+        self.etapas = fundir_filtros(self.filtros)  # Etapas efetivamente executadas.
+
+    def na_qualidade(self, qualidade):
+        return CadeiaDeFiltros([filtro.na_qualidade(qualidade) for filtro in self.filtros], self.nome)
+
+    def na_escala(self, escala):
+        if escala == 1.0:
+            return self
+        return CadeiaDeFiltros([filtro.na_escala(escala) for filtro in self.filtros], self.nome)
+
+    def em_faixas(self, altura, largura):
+        etapas = []
+        halo_total = 0
+        for etapa in self.etapas:
+            divisao = etapa.em_faixas(altura, largura)
+            if divisao is None:
+                return None  # Basta uma etapa indivisível para a cadeia inteira ser indivisível.
+            etapas.append(divisao[0])
+            # Os erros de borda de cada etapa avançam pelo seu raio, então os halos se somam.
+            halo_total += divisao[1]
+        return CadeiaDeFiltros(etapas, self.nome), halo_total
+
+    def aplicar(self, imagem, destino=None, intermediarios=None):
+        """
+        Aplica as etapas em sequência. O resultado final vai para 'destino'; os resultados das
+        etapas intermediárias são reaproveitados de 'intermediarios' (um PoolDeQuadros), se fornecido.
+        """
+        # Sem etapas, a cadeia equivale ao filtro original.
+        if not self.etapas:
+            return copiar_para(imagem, destino)
+        resultado = imagem
+        ultima = len(self.etapas) - 1
+        for i, etapa in enumerate(self.etapas):
+            if i == ultima:
+                alvo = destino
+            else:
+                alvo = intermediarios.reciclar(("etapa", i)) if intermediarios is not None else None
+            resultado = etapa.aplicar(resultado, alvo)  # Cada etapa é uma única passada.
+            if i < ultima and intermediarios is not None:
+                intermediarios.guardar(("etapa", i), resultado)
+        return resultado
+
+filtros_registrados = []  # Lista de filtros, na mesma ordem em que aparecem na barra.
+nomes_filtros = []        # Lista com os nomes dos filtros disponíveis.
+
+def registrar_filtro(filtro):
+    """
+    Adiciona um filtro ao final da barra de filtros. O índice do filtro é a sua posição no registro.
+    """
+    filtros_registrados.append(filtro)  # O despachante acessa o filtro diretamente pelo índice.
+    nomes_filtros.append(filtro.nome)   # Mantém a lista de nomes sincronizada com o registro.
+    return filtro
+
+registrar_filtro(FiltroOriginal("Original"))                                # Filtro 0: Sem alterações na imagem.
+registrar_filtro(FiltroPontual("Escala de Cinza", valores_pixel, usa_cinza=True))    # Filtro 1: Converte a imagem para preto e branco.
+registrar_filtro(FiltroPontual("Inversão", 255 - valores_pixel))            # Filtro 2: Inverte as cores da imagem.
+registrar_filtro(FiltroDesfoque("Desfoque", 7))                             # Filtro 3: Aplica um desfoque na imagem.
+registrar_filtro(FiltroPontual("Efeito Tumblr", tabela_mapa_de_cores(cv2.COLORMAP_PINK), usa_cinza=True))    # Filtro 4: Aplica um efeito de tonalidade rosa.
+registrar_filtro(FiltroPontual("Efeito Prism", tabela_mapa_de_cores(cv2.COLORMAP_RAINBOW), usa_cinza=True))  # Filtro 5: Aplica um efeito de arco-íris.
+registrar_filtro(FiltroMatrizCor("Vintage", [[0.272, 0.534, 0.131],         # Filtro 6: Aplica uma tonalidade sépia para um estilo retrô.
+                                             [0.349, 0.686, 0.168],
+                                             [0.393, 0.769, 0.189]]))
+registrar_filtro(FiltroPontual("Silly Face", valores_pixel + 30))           # Filtro 7: Aumenta o brilho da imagem.
+registrar_filtro(FiltroBilateral("Kyle+Kendall Slim", 15, 80, 80))          # Filtro 8: Aplica suavização à imagem.
+registrar_filtro(FiltroPontual("Filtro Kodak", valores_pixel + 20))         # Filtro 9: Simula cores mais quentes, estilo filme Kodak.
+registrar_filtro(FiltroPontual("Efeito Preto e Vermelho",                   # Filtro 10: Cria um efeito preto e vermelho.
+                               np.stack([np.zeros(256), np.zeros(256), valores_pixel], axis=1), usa_cinza=True))
+registrar_filtro(FiltroMatrizCor("Cross Process", [[0.80, 0.00, 0.00],     # Filtro 11: Sombras azuladas e realces amarelados.
+                                                  [0.00, 1.10, 0.05],
+                                                  [0.05, 0.00, 1.15]], deslocamento=(25, -8, -10)))
+registrar_filtro(FiltroMatrizCor("Teal e Laranja", [[0.95, 0.10, -0.10],   # Filtro 12: Tons de pele alaranjados e fundo esverdeado.
+                                                   [0.00, 1.00, 0.00],
+                                                   [-0.10, 0.05, 1.10]], deslocamento=(12, 0, -4)))
+
+def registrar_luts(pasta=PASTA_LUTS):
+    """
+    Registra como filtros todas as LUTs 3D (.cube) de uma pasta, em ordem alfabética.
+    """
+    for arquivo in sorted(os.listdir(pasta)):
+        if arquivo.lower().endswith(".cube"):
+            try:
+                registrar_filtro(carregar_lut_cube(os.path.join(pasta, arquivo)))
+            except (OSError, ValueError) as erro:
+                print(f"Erro ao carregar a LUT {arquivo}: {erro}")
+
+# ---------------------------------------
+# Execução em faixas paralelas
+# ---------------------------------------
+
+NUM_TRABALHADORES = os.cpu_count() or 1  # Número padrão de threads para imagens grandes.
+LIMIAR_PIXELS_PARALELO = 4_000_000        # Abaixo disso, dividir a imagem custa mais do que ganha.
+ALTURA_MINIMA_FAIXA = 64                  # Faixas menores desperdiçam tempo recalculando o halo.
+
+class ExecutorEmFaixas:
+    """
+    Aplica filtros em imagens grandes dividindo-as em faixas horizontais processadas em paralelo.
+    Cada faixa é lida com o halo de linhas vizinhas que o filtro precisa, e só as suas linhas
+    próprias são gravadas em uma imagem de saída alocada uma única vez. O resultado é idêntico,
+    bit a bit, ao da aplicação na imagem inteira (o OpenCV libera o GIL durante os filtros).
+    """
+    def __init__(self, num_trabalhadores=NUM_TRABALHADORES, limiar_pixels=LIMIAR_PIXELS_PARALELO):
+        self.num_trabalhadores = max(1, num_trabalhadores)  # Threads usadas por aplicação.
+        self.limiar_pixels = limiar_pixels                  # Tamanho mínimo para dividir a imagem.
+        self.pool = ThreadPoolExecutor(max_workers=self.num_trabalhadores) if self.num_trabalhadores > 1 else None
+
+    def limites_faixas(self, altura):
+        """
+        Retorna a lista de intervalos (inicio, fim) de linhas de cada faixa.
+        """
+        # Duas faixas por thread equilibram a carga quando algumas terminam antes.
+        num_faixas = max(1, min(self.num_trabalhadores * 2, altura // ALTURA_MINIMA_FAIXA))
+        cortes = [altura * i // num_faixas for i in range(num_faixas + 1)]
+        return list(zip(cortes[:-1], cortes[1:]))
+
+    def aplicar(self, filtro, imagem, destino=None):
+        """
+        Aplica o filtro na imagem, em paralelo quando a imagem é grande e o filtro pode ser dividido.
+        O resultado é gravado em 'destino' quando ele tem o formato certo.
+        """
+        altura, largura = imagem.shape[:2]
+        divisao = None
+        if self.pool is not None and altura * largura >= self.limiar_pixels:
+            divisao = filtro.em_faixas(altura, largura)
+        if divisao is None:
+            return filtro.aplicar(imagem, destino)  # Caminho de uma única thread.
+        filtro_faixa, halo = divisao
+
+        # Descobre o formato da saída (número de canais, forma compacta e tipo) em um pedaço mínimo da imagem.
+        amostra = filtro_faixa.aplicar(imagem[:2, :2])
+        compacta = isinstance(amostra, ImagemCanalUnico)
+        forma = (altura, largura) + (() if compacta else amostra.shape[2:])
+        plano = destino_para(destino, forma, amostra.dtype)
+        if plano is None:
+            plano = np.empty(forma, dtype=amostra.dtype)
+        saida = ImagemCanalUnico(plano, amostra.canal) if compacta else plano
+
+        def processar_faixa(inicio, fim):
+            # Lê a faixa com o halo, limitado às bordas reais da imagem.
+            topo = max(0, inicio - halo)
+            base = min(altura, fim + halo)
+            resultado = filtro_faixa.aplicar(imagem[topo:base])
+            # Grava só as linhas próprias da faixa na saída.
+            saida[inicio:fim] = resultado[inicio - topo:fim - topo]
+
+        tarefas = [self.pool.submit(processar_faixa, inicio, fim) for inicio, fim in self.limites_faixas(altura)]
+        for tarefa in tarefas:
+            tarefa.result()  # Propaga qualquer erro ocorrido nas threads.
+        return saida
+
+# Executor compartilhado pelo editor. O número de threads pode ser trocado criando outro executor.
+executor_faixas = ExecutorEmFaixas()
+
+# ---------------------------------------
+# Processamento em faixas direto do disco (imagens gigantes)
+# ---------------------------------------
+
+ALTURA_FAIXA_DISCO = 256  # Linhas lidas, filtradas e gravadas por vez no modo de fluxo.
+
+def ler_cabecalho_pnm(arquivo):
+    """
+    Lê o cabeçalho de um arquivo PPM (P6) ou PGM (P5) binário.
+    Retorna (tipo, largura, altura, valor_maximo, posição onde começam os pixels).
+    """
+    campos = []
+    while len(campos) < 4:
+        linha = arquivo.readline()
+        if not linha:
+            raise ValueError("Cabeçalho PNM incompleto.")
+        # Ignora comentários, que vão de '#' até o fim da linha.
+        campos += linha.split(b"#")[0].split()
+    tipo, largura, altura, valor_maximo = campos[0].decode(), int(campos[1]), int(campos[2]), int(campos[3])
+    # Os pixels começam logo depois do único espaço em branco que segue o valor máximo.
+    return tipo, largura, altura, valor_maximo, arquivo.tell()
+
+class FonteEmFaixas:
+    """
+    Imagem de origem lida aos pedaços. Arquivos .npy e PPM/PGM binários são mapeados em memória
+    e só as linhas pedidas são lidas do disco; outros formatos precisam ser decodificados inteiros
+    pelo OpenCV, o que anula a economia de memória (um aviso é exibido nesse caso).
+    """
+    def __init__(self, caminho):
+        self.rgb = False  # PPM guarda os canais na ordem RGB; o resto do programa usa BGR.
+        extensao = os.path.splitext(caminho)[1].lower()
+        if extensao == ".npy":
+            self.pixels = np.load(caminho, mmap_mode="r")  # Nada é lido até que as linhas sejam acessadas.
+        elif extensao in (".ppm", ".pgm", ".pnm"):
+            with open(caminho, "rb") as arquivo:
+                tipo, largura, altura, valor_maximo, inicio = ler_cabecalho_pnm(arquivo)
+            if tipo not in ("P5", "P6") or valor_maximo > 255:
+                raise ValueError("Só arquivos PPM/PGM binários de 8 bits podem ser lidos em faixas.")
+            formato = (altura, largura, 3) if tipo == "P6" else (altura, largura)
+            self.pixels = np.memmap(caminho, dtype=np.uint8, mode="r", offset=inicio, shape=formato)
+            self.rgb = tipo == "P6"
+        else:
+            print(f"Aviso: {extensao} não pode ser lido em faixas; a imagem será carregada inteira.")
+            self.pixels = cv2.imread(caminho)
+            if self.pixels is None:
+                raise ValueError(f"Erro ao carregar a imagem: {caminho}")
+        self.altura, self.largura = self.pixels.shape[:2]
+
+    def ler(self, inicio, fim):
+        """
+        Lê as linhas [inicio, fim) da imagem, já em BGR de três canais.
+        """
+        faixa = np.ascontiguousarray(self.pixels[inicio:fim])  # Só essas linhas saem do disco.
+        if faixa.ndim == 2:
+            return cv2.cvtColor(faixa, cv2.COLOR_GRAY2BGR)
+        if self.rgb:
+            return cv2.cvtColor(faixa, cv2.COLOR_RGB2BGR)
+        return faixa
+
+class DestinoEmFaixas:
+    """
+    Imagem de saída gravada aos pedaços em um buffer mapeado em memória no disco (.npy ou PPM/PGM).
+    """
+    def __init__(self, caminho, altura, largura, canais):
+        extensao = os.path.splitext(caminho)[1].lower()
+        formato = (altura, largura, canais) if canais > 1 else (altura, largura)
+        self.rgb = False
+        if extensao == ".npy":
+            self.pixels = np.lib.format.open_memmap(caminho, mode="w+", dtype=np.uint8, shape=formato)
+        elif extensao in (".ppm", ".pgm", ".pnm"):
+            # Grava o cabeçalho e mapeia o restante do arquivo como a matriz de pixels.
+            cabecalho = f"{'P6' if canais > 1 else 'P5'}\n{largura} {altura}\n255\n".encode()
+            with open(caminho, "wb") as arquivo:
+                arquivo.write(cabecalho)
+            self.pixels = np.memmap(caminho, dtype=np.uint8, mode="r+", offset=len(cabecalho), shape=formato)
+            self.rgb = canais > 1
+        else:
+            raise ValueError("A saída em faixas precisa ser um arquivo .npy, .ppm ou .pgm.")
+
+    def gravar(self, inicio, faixa):
+        """
+        Grava a faixa a partir da linha 'inicio' e libera as páginas já escritas para o disco.
+        """
+        if self.rgb:
+            faixa = cv2.cvtColor(faixa, cv2.COLOR_BGR2RGB)
+        self.pixels[inicio:inicio + faixa.shape[0]] = faixa
+        self.pixels.flush()
+
+    def fechar(self):
+        self.pixels.flush()
+        del self.pixels  # Fecha o mapeamento do arquivo.
+
+def processar_em_faixas(caminho_entrada, caminho_saida, filtro, altura_faixa=ALTURA_FAIXA_DISCO):
+    """
+    Aplica um filtro em uma imagem que não cabe na memória, lendo, filtrando e gravando uma faixa
+    por vez. O pico de memória depende da altura da faixa (mais o halo do filtro) e não da imagem.
+    """
+    fonte = FonteEmFaixas(caminho_entrada)
+    divisao = filtro.em_faixas(fonte.altura, fonte.largura)
+    if divisao is None:
+        raise ValueError(f"O filtro '{filtro.nome}' depende da imagem inteira e não pode ser aplicado em faixas.")
+    filtro_faixa, halo = divisao
+
+    destino = None
+    for inicio in range(0, fonte.altura, altura_faixa):
+        fim = min(fonte.altura, inicio + altura_faixa)
+        # Lê a faixa com o halo, limitado às bordas reais da imagem.
+        topo = max(0, inicio - halo)
+        base = min(fonte.altura, fim + halo)
+        resultado = filtro_faixa.aplicar(fonte.ler(topo, base))
+        # Um resultado de canal único é gravado como BGR; um resultado em cinza, como PGM/matriz 2D.
+        if isinstance(resultado, ImagemCanalUnico):
+            resultado = expandir_para_bgr(resultado)
+        if destino is None:
+            # O número de canais da saída só é conhecido depois da primeira faixa.
+            canais = resultado.shape[2] if resultado.ndim == 3 else 1
+            destino = DestinoEmFaixas(caminho_saida, fonte.altura, fonte.largura, canais)
+        destino.gravar(inicio, resultado[inicio - topo:fim - topo])
+    destino.fechar()
+    print(f"Imagem salva em {caminho_saida}")
+
+# ---------------------------------------
+# Cache de resultados de filtros
+# ---------------------------------------
+
+ORCAMENTO_CACHE_BYTES = 256 * 1024 * 1024  # Memória máxima ocupada pelos resultados guardados.
+
+class CacheResultados:
+    """
+    Guarda resultados de filtros já calculados, com descarte do menos usado recentemente (LRU)
+    quando a soma dos tamanhos passa do orçamento em bytes. As imagens guardadas ficam somente
+    leitura; quem for alterá-las (por exemplo, colando adesivos) deve trabalhar em uma cópia.
+    """
+    def __init__(self, orcamento_bytes=ORCAMENTO_CACHE_BYTES):
+        self.orcamento_bytes = orcamento_bytes  # Limite de memória do cache.
+        self.bytes_usados = 0                   # Soma dos tamanhos das imagens guardadas.
+        self.acertos = 0                        # Quantas vezes o resultado já estava guardado.
+        self.falhas = 0                         # Quantas vezes foi preciso calcular o resultado.
+        self.itens = OrderedDict()              # Do menos para o mais usado recentemente.
+        self.trava = threading.Lock()           # Protege o cache quando usado por mais de uma thread.
+
+    def obter(self, chave, calcular):
+        """
+        Retorna o resultado guardado para a chave ou, se não houver, chama calcular() e guarda o resultado.
+        """
+        with self.trava:
+            if chave in self.itens:
+                self.acertos += 1
+                self.itens.move_to_end(chave)  # Marca como o mais usado recentemente.
+                return self.itens[chave]
+            self.falhas += 1
+        # O cálculo fica fora da trava para não bloquear outras consultas.
+        resultado = calcular()
+        resultado.flags.writeable = False
+        with self.trava:
+            # Resultados maiores que o orçamento inteiro não são guardados.
+            if resultado.nbytes <= self.orcamento_bytes and chave not in self.itens:
+                self.itens[chave] = resultado
+                self.bytes_usados += resultado.nbytes
+                # Descarta os menos usados até voltar a caber no orçamento.
+                while self.bytes_usados > self.orcamento_bytes:
+                    _, descartado = self.itens.popitem(last=False)
+                    self.bytes_usados -= descartado.nbytes
+        return resultado
+
+    def limpar(self):
+        """
+        Remove todos os resultados guardados (os contadores são mantidos).
+        """
+        with self.trava:
+            self.itens.clear()
+            self.bytes_usados = 0
+
+# ---------------------------------------
+# Adesivos compilados
+# ---------------------------------------
+
+# Abaixo dessa fração de pixels visíveis no recorte, o adesivo é colado pelos trechos visíveis
+# de cada linha em vez de pela caixa inteira.
+LIMIAR_OCUPACAO_TRECHOS = 0.6
+# Lado maior de um adesivo colado, como fração do lado menor da imagem de destino.
+FRACAO_ADESIVO = 0.3
+# Quantas escalas já reamostradas cada adesivo guarda (as usadas há mais tempo saem primeiro).
+LIMITE_VARIANTES_ADESIVO = 32
+# Lado, em pixels, das células da grade que indexa os adesivos de uma cena.
+TAMANHO_CELULA_CENA = 64
+# Adesivos disponíveis: nome -> arquivo PNG com transparência (canal alfa).
+ARQUIVOS_ADESIVOS = {
+    'oculos': 'eyeglasses.png',
+    'chapeu': 'hat.png',
+    'estrela': 'star.png',
+    'arvore': 'arvore.png',
+    'alce': 'alce.png',
+    'nascimento': 'nascimento.png',
+}
+
+def carregar_adesivos(arquivos=ARQUIVOS_ADESIVOS, pasta="."):
+    """
+    Lê os adesivos com transparência, cada um com canal alfa (IMREAD_UNCHANGED).
+    Retorna um dicionário nome -> imagem BGRA, na ordem dada; um arquivo que não pode ser lido gera OSError.
+    """
+    adesivos = {}
+    for nome, arquivo in arquivos.items():
+        imagem = cv2.imread(os.path.join(pasta, arquivo), cv2.IMREAD_UNCHANGED)
+        if imagem is None:
+            raise OSError(f"Erro ao carregar o adesivo: {nome}")
+        adesivos[nome] = imagem
+    return adesivos
+
+def calcular_trechos(visiveis):
+    """
+    Codifica uma máscara booleana em trechos (run-length): uma linha (linha, início, fim) para cada
+    sequência contínua de pixels visíveis de uma linha, com o fim exclusivo.
+    """
+    bordas = np.diff(np.pad(visiveis.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    linhas, inicios = np.nonzero(bordas == 1)  # Transições de transparente para visível.
+    _, fins = np.nonzero(bordas == -1)          # Transições de visível para transparente, na mesma ordem.
+    return np.stack([linhas, inicios, fins], axis=1).astype(np.int32)
+
+class AdesivoCompilado:
+    """
+    Adesivo preparado uma única vez para ser colado: recortado na menor caixa que contém todos os
+    pixels não transparentes, com as cores já multiplicadas pelo alfa (pré-multiplicadas) e a máscara
+    alfa separada. Adesivos com muita transparência dentro da caixa guardam também os trechos
+    (run-length) de pixels visíveis, e a colagem só passa pelos pixels que realmente mudam.
+    Outras escalas são reamostradas de uma pirâmide de reduções pela metade (mipmap) e guardadas,
+    de modo que colar de novo na mesma escala não redimensiona nada.
+    """
+    def __init__(self, nome, cor, alfa, deslocamento=(0, 0), tamanho_original=None, usar_trechos=None):
+        self.nome = nome
+        self.niveis = None               # Pirâmide de reduções pela metade, montada sob demanda.
+        self.variantes = OrderedDict()   # Versões reamostradas, por tamanho do lado maior em pixels.
+        self.trava = threading.Lock()
+        # Tamanho (largura, altura) do adesivo original, antes do recorte.
+        self.tamanho_original = tamanho_original or (alfa.shape[1], alfa.shape[0])
+        # Menor caixa que contém os pixels com alfa não nulo; as margens transparentes são descartadas.
+        x, y, largura, altura = cv2.boundingRect(alfa)
+        self.deslocamento = (deslocamento[0] + x, deslocamento[1] + y)  # Posição do recorte no adesivo original.
+        self.cor = np.ascontiguousarray(cor[y:y + altura, x:x + largura])    # BGR pré-multiplicado pelo alfa.
+        self.alfa = np.ascontiguousarray(alfa[y:y + altura, x:x + largura])  # Opacidade de 0 a 255.
+        # Peso do fundo em cada pixel, em ponto fixo de 8 bits (256 = fundo inteiro, 0 = adesivo opaco), por canal.
+        peso = np.rint((255 - self.alfa.astype(np.float32)) * 256 / 255).astype(np.uint16)
+        self.peso_fundo = np.repeat(peso[..., None], 3, axis=2)
+
+        visiveis = self.alfa > 0
+        if usar_trechos is None:
+            usar_trechos = visiveis.size > 0 and visiveis.mean() < LIMIAR_OCUPACAO_TRECHOS
+        self.trechos = calcular_trechos(visiveis) if usar_trechos else None
+        if self.trechos is not None:
+            # Coordenadas (dentro do recorte) de cada pixel visível, expandidas dos trechos,
+            # com a cor e o peso do fundo já separados na mesma ordem.
+            comprimentos = self.trechos[:, 2] - self.trechos[:, 1]
+            self.linhas = np.repeat(self.trechos[:, 0], comprimentos).astype(np.intp)
+            inicio_de_cada = np.repeat(np.cumsum(comprimentos) - comprimentos, comprimentos)
+            self.colunas = (np.repeat(self.trechos[:, 1], comprimentos) + np.arange(comprimentos.sum()) - inicio_de_cada).astype(np.intp)
+            self.cor_visivel = self.cor[self.linhas, self.colunas]
+            self.peso_visivel = self.peso_fundo[self.linhas, self.colunas]
+
+    def escala_relativa(self, altura, largura):
+        """
+        Escala que deixa o lado maior do adesivo com FRACAO_ADESIVO do lado menor de uma imagem
+        altura x largura, para o adesivo ter o mesmo tamanho aparente em qualquer resolução.
+        """
+        return FRACAO_ADESIVO * min(altura, largura) / max(self.tamanho_original)
+
+    def na_escala(self, escala):
+        """
+        Retorna o adesivo na escala dada (arredondada para um lado maior inteiro em pixels),
+        reamostrado uma única vez e guardado para as próximas colagens.
+        """
+        lado = max(1, round(escala * max(self.tamanho_original)))
+        with self.trava:
+            variante = self.variantes.get(lado)
+            if variante is None:
+                variante = self.reamostrado(lado / max(self.tamanho_original))
+                self.variantes[lado] = variante
+                if len(self.variantes) > LIMITE_VARIANTES_ADESIVO:
+                    self.variantes.popitem(last=False)  # Descarta a escala usada há mais tempo.
+            else:
+                self.variantes.move_to_end(lado)
+            return variante
+
+    def piramide(self):
+        """
+        Retorna os níveis do mipmap: o próprio adesivo e reduções sucessivas pela metade.
+        """
+        if self.niveis is None:
+            niveis = [self]
+            while min(niveis[-1].alfa.shape) >= 2 and max(niveis[-1].tamanho_original) > 8:
+                niveis.append(niveis[-1].redimensionado(0.5))
+            self.niveis = niveis
+        return self.niveis
+
+    def reamostrado(self, escala):
+        """
+        Reamostra o adesivo a partir do menor nível da pirâmide que ainda é maior do que o pedido,
+        de modo que a redução final nunca passa de metade e custa pouco.
+        """
+        if escala >= 1.0:
+            return self.redimensionado(escala)
+        niveis = self.piramide()
+        nivel = min(int(np.floor(np.log2(1 / escala))), len(niveis) - 1)
+        base = niveis[nivel]
+        return base.redimensionado(escala * max(self.tamanho_original) / max(base.tamanho_original))
+
+    def redimensionado(self, escala):
+        """
+        Retorna o adesivo redimensionado diretamente na escala dada. Cores pré-multiplicadas podem
+        ser interpoladas diretamente, sem bordas escuras nas regiões semitransparentes.
+        """
+        if escala == 1.0 or self.alfa.size == 0:
+            return self
+        largura_original, altura_original = self.tamanho_original
+        altura, largura = self.alfa.shape
+        tamanho = (max(1, round(largura * escala)), max(1, round(altura * escala)))
+        # Média por área para reduzir; interpolação bilinear para ampliar.
+        interpolacao = cv2.INTER_AREA if escala < 1.0 else cv2.INTER_LINEAR
+        return AdesivoCompilado(self.nome,
+                                cv2.resize(self.cor, tamanho, interpolation=interpolacao),
+                                cv2.resize(self.alfa, tamanho, interpolation=interpolacao),
+                                (round(self.deslocamento[0] * escala), round(self.deslocamento[1] * escala)),
+                                (max(1, round(largura_original * escala)), max(1, round(altura_original * escala))))
+
+def compilar_adesivo(nome, imagem):
+    """
+    Compila um adesivo lido do disco (BGR ou BGRA): separa o alfa e pré-multiplica as cores.
+    """
+    if imagem.shape[2] == 4:
+        cor, alfa = imagem[..., :3], np.ascontiguousarray(imagem[..., 3])
+    else:
+        # Sem canal alfa, o adesivo é todo opaco.
+        cor, alfa = imagem, np.full(imagem.shape[:2], 255, dtype=np.uint8)
+    cor_pre_multiplicada = (cor.astype(np.uint16) * alfa[..., None] + 127) // 255
+    return AdesivoCompilado(nome, cor_pre_multiplicada.astype(np.uint8), alfa)
+
+def misturar_alfa(fundo, cor, peso):
+    """
+    Núcleo da colagem, em aritmética inteira de ponto fixo e no próprio array 'fundo':
+    fundo = cor + (fundo * peso + 128) >> 8, com a cor pré-multiplicada e o peso do fundo em 1/256.
+    O único temporário é um buffer de 16 bits da thread, do tamanho do maior adesivo já colado,
+    então colar muitos adesivos por quadro não aloca nada.
+    """
+    mistura = pool_da_thread().no_minimo("mistura", fundo.size, np.uint16).reshape(fundo.shape)
+    np.multiply(fundo, peso, out=mistura, dtype=np.uint16)  # No máximo 255 * 256 + 128: cabe em 16 bits.
+    np.add(mistura, 128, out=mistura)
+    np.right_shift(mistura, 8, out=mistura)
+    np.add(mistura, cor, out=mistura)  # Nunca passa de 255: a cor pré-multiplicada não excede o alfa.
+    np.copyto(fundo, mistura, casting="unsafe")
+
+def regiao_adesivo(forma, adesivo, x, y):
+    """
+    Retângulo (topo, base, esquerda, direita) de uma imagem com a forma dada que um adesivo compilado
+    colado em (x, y) pode alterar, já cortado nas bordas. Retorna None se o adesivo fica inteiro fora.
+    """
+    altura, largura = adesivo.alfa.shape
+    x += adesivo.deslocamento[0]
+    y += adesivo.deslocamento[1]
+    topo, base = max(0, y), min(forma[0], y + altura)
+    esquerda, direita = max(0, x), min(forma[1], x + largura)
+    if topo >= base or esquerda >= direita:
+        return None
+    return topo, base, esquerda, direita
+
+def compor_adesivo(imagem_fundo, adesivo, x, y):
+    """
+    Cola um adesivo compilado com o canto superior esquerdo do adesivo original em (x, y):
+    resultado = cor pré-multiplicada + fundo * (255 - alfa) / 255. Partes fora da imagem são cortadas.
+    """
+    altura, largura = adesivo.alfa.shape
+    x += adesivo.deslocamento[0]
+    y += adesivo.deslocamento[1]
+    # Parte do recorte que cai dentro da imagem.
+    esquerda, topo = max(0, -x), max(0, -y)
+    direita = min(largura, imagem_fundo.shape[1] - x)
+    base = min(altura, imagem_fundo.shape[0] - y)
+    if esquerda >= direita or topo >= base:
+        return  # O adesivo está inteiro fora da imagem.
+    cortado = topo > 0 or esquerda > 0 or base < altura or direita < largura
+
+    if adesivo.trechos is None or cortado or not imagem_fundo.flags.c_contiguous:
+        # Mistura a caixa (visível) inteira de uma vez, direto na região da imagem.
+        misturar_alfa(imagem_fundo[y + topo:y + base, x + esquerda:x + direita],
+                      adesivo.cor[topo:base, esquerda:direita], adesivo.peso_fundo[topo:base, esquerda:direita])
+        return
+
+    # Adesivo com muita transparência: só os pixels visíveis são lidos e escritos.
+    quantidade = len(adesivo.linhas)
+    rascunho = pool_da_thread()
+    largura_fundo = imagem_fundo.shape[1]
+    # Posição de cada pixel visível na imagem vista como uma lista de pixels.
+    indices = rascunho.no_minimo("indices_adesivo", quantidade, np.intp)
+    np.multiply(adesivo.linhas, largura_fundo, out=indices)
+    np.add(indices, adesivo.colunas, out=indices)
+    np.add(indices, y * largura_fundo + x, out=indices)
+    pixels_fundo = imagem_fundo.reshape(-1, 3)
+    pixels = rascunho.no_minimo("pixels_adesivo", quantidade * 3, np.uint8).reshape(quantidade, 3)
+    np.take(pixels_fundo, indices, axis=0, out=pixels)
+    misturar_alfa(pixels, adesivo.cor_visivel, adesivo.peso_visivel)
+    pixels_fundo[indices] = pixels
+
+def montar_cadeia(indices, qualidade=QUALIDADE_EXATA):
+    """
+    Monta a cadeia de filtros correspondente a uma lista de índices do registro, no nível de qualidade pedido.
+    """
+    return CadeiaDeFiltros([filtros_registrados[i].na_qualidade(qualidade) for i in indices])
+
+def preparar_proxy(imagem, tamanho=None):
+    """
+    Cria a cópia reduzida da imagem que cabe em 'tamanho' (largura, altura), usada durante a interação.
+    Retorna a cópia e a escala em relação à imagem original (nunca amplia). Sem 'tamanho', não há cópia.
+    """
+    altura, largura = imagem.shape[:2]
+    if tamanho is None:
+        return imagem, 1.0  # Edição direto na resolução cheia.
+    escala = min(1.0, tamanho[0] / largura, tamanho[1] / altura)
+    if escala == 1.0:
+        return imagem, 1.0  # A própria imagem já é pequena.
+    tamanho = (max(1, int(largura * escala)), max(1, int(altura * escala)))
+    return cv2.resize(imagem, tamanho, interpolation=cv2.INTER_AREA), escala
+
+class InstanciaAdesivo:
+    """
+    Um adesivo colocado na cena: qual adesivo, onde (canto superior esquerdo do adesivo original)
+    e em que escala. Guarda a versão já reamostrada e o retângulo que ela ocupa.
+    """
+    def __init__(self, ordem, adesivo, x, y, escala):
+        self.ordem = ordem      # Ordem de colocação: as instâncias mais novas ficam por cima.
+        self.x, self.y = x, y
+        self.escala = escala
+        self.adesivo = adesivo.na_escala(escala)
+        altura, largura = self.adesivo.alfa.shape
+        esquerda = x + self.adesivo.deslocamento[0]
+        topo = y + self.adesivo.deslocamento[1]
+        self.retangulo = (esquerda, topo, esquerda + largura, topo + altura)  # (x0, y0, x1, y1), x1/y1 exclusivos.
+
+class CenaDeAdesivos:
+    """
+    Adesivos colocados sobre um vídeo (ou qualquer sequência de quadros), guardados como instâncias (adesivo, posição, escala) em vez
+    de uma camada do tamanho do frame. Uma grade de células (índice espacial) diz quais instâncias
+    tocam uma região, e a composição só passa pelos retângulos dos adesivos: o custo por frame
+    depende da área dos adesivos, não do tamanho do frame.
+    """
+    def __init__(self, tamanho_celula=TAMANHO_CELULA_CENA):
+        self.tamanho_celula = tamanho_celula
+        self.instancias = []   # Em ordem de colocação.
+        self.celulas = {}      # (coluna, linha) da célula -> instâncias que a tocam.
+        self.proxima_ordem = 0
+
+    def __len__(self):
+        return len(self.instancias)
+
+    def _celulas_do_retangulo(self, x0, y0, x1, y1):
+        """
+        Células da grade cobertas pelo retângulo [x0, x1) x [y0, y1).
+        """
+        lado = self.tamanho_celula
+        for linha in range(y0 // lado, (y1 - 1) // lado + 1):
+            for coluna in range(x0 // lado, (x1 - 1) // lado + 1):
+                yield coluna, linha
+
+    def adicionar(self, adesivo, x, y, escala):
+        """
+        Coloca o adesivo compilado em (x, y), na escala dada, e o registra nas células que ele cobre.
+        """
+        instancia = InstanciaAdesivo(self.proxima_ordem, adesivo, x, y, escala)
+        self.proxima_ordem += 1
+        self.instancias.append(instancia)
+        x0, y0, x1, y1 = instancia.retangulo
+        if x0 < x1 and y0 < y1:  # Um adesivo todo transparente não ocupa célula nenhuma.
+            for celula in self._celulas_do_retangulo(x0, y0, x1, y1):
+                self.celulas.setdefault(celula, []).append(instancia)
+        return instancia
+
+    def remover_ultimo(self):
+        """
+        Tira da cena o adesivo colocado por último. Retorna a instância removida, ou None se a cena estiver vazia.
+        """
+        if not self.instancias:
+            return None
+        instancia = self.instancias.pop()
+        x0, y0, x1, y1 = instancia.retangulo
+        if x0 < x1 and y0 < y1:
+            for celula in self._celulas_do_retangulo(x0, y0, x1, y1):
+                ocupantes = self.celulas[celula]
+                ocupantes.remove(instancia)
+                if not ocupantes:
+                    del self.celulas[celula]
+        return instancia
+
+    def limpar(self):
+        self.instancias.clear()
+        self.celulas.clear()
+
+    def consultar(self, x0, y0, x1, y1):
+        """
+        Retorna, de baixo para cima, as instâncias cujo retângulo cruza a região [x0, x1) x [y0, y1).
+        """
+        if x0 >= x1 or y0 >= y1 or not self.instancias:
+            return []
+        lado = self.tamanho_celula
+        colunas = range(x0 // lado, (x1 - 1) // lado + 1)
+        linhas = range(y0 // lado, (y1 - 1) // lado + 1)
+        if len(colunas) * len(linhas) <= len(self.celulas):
+            candidatas = (self.celulas.get(celula, ()) for celula in self._celulas_do_retangulo(x0, y0, x1, y1))
+        else:
+            # Região grande (como o frame inteiro): percorre só as células ocupadas, e não a região toda.
+            candidatas = (ocupantes for (coluna, linha), ocupantes in self.celulas.items()
+                          if coluna in colunas and linha in linhas)
+        encontradas = {}
+        for ocupantes in candidatas:
+            for instancia in ocupantes:
+                ix0, iy0, ix1, iy1 = instancia.retangulo
+                if ix0 < x1 and x0 < ix1 and iy0 < y1 and y0 < iy1:
+                    encontradas[instancia.ordem] = instancia
+        return [encontradas[ordem] for ordem in sorted(encontradas)]
+
+    def compor(self, quadro):
+        """
+        Cola no lugar, sobre o quadro, os adesivos que aparecem nele (os que ficaram fora não custam nada).
+        """
+        for instancia in self.consultar(0, 0, quadro.shape[1], quadro.shape[0]):
+            compor_adesivo(quadro, instancia.adesivo, instancia.x, instancia.y)
+
+def aplicar_filtro_generico(imagem_base, indice_filtro, destino=None):
+    """
+    Aplica um dos filtros registrados na imagem base fornecida, gravando em 'destino' quando possível.
+    """
+    # Verifica se a imagem base é válida (não é None). Se não for, retorna None.
+    if imagem_base is None:
+        return None
+
+    # Busca o filtro diretamente pelo índice no registro, sem percorrer uma cadeia de condições.
+    if 0 <= indice_filtro < len(filtros_registrados):
+        return executor_faixas.aplicar(filtros_registrados[indice_filtro], imagem_base, destino)
+
+    # Caso o índice não corresponda a nenhum filtro, retorna a imagem original.
+    return imagem_base
+
+# ---------------------------------------
+# Sessão de edição
+# ---------------------------------------
+
+ORCAMENTO_HISTORICO_BYTES = 64 * 1024 * 1024  # Memória máxima ocupada pelos passos para desfazer.
+
+class HistoricoDeEdicao:
+    """
+    Passos para desfazer as operações de uma sessão, do mais antigo para o mais recente. Um adesivo
+    guarda só os pixels anteriores do retângulo que alterou (um retalho); um filtro, que muda a imagem
+    inteira, guarda só uma referência, e o estado anterior é refeito a partir das operações registradas.
+    Quando a soma dos retalhos passa do orçamento em bytes, os passos mais antigos são descartados
+    e deixam de poder ser desfeitos.
+    """
+    def __init__(self, orcamento_bytes=ORCAMENTO_HISTORICO_BYTES):
+        self.orcamento_bytes = orcamento_bytes  # Limite de memória dos retalhos guardados.
+        self.bytes_usados = 0                   # Soma dos tamanhos dos retalhos guardados.
+        self.passos = deque()                   # (região, retalho) ou None (refazer pelas operações).
+
+    def __len__(self):
+        return len(self.passos)
+
+    def guardar_retalho(self, imagem, regiao):
+        """
+        Guarda os pixels atuais da região (topo, base, esquerda, direita) da imagem, antes de alterá-la.
+        """
+        topo, base, esquerda, direita = regiao
+        self.adicionar((regiao, imagem[topo:base, esquerda:direita].copy()))
+
+    def guardar_referencia(self):
+        """
+        Guarda um passo sem pixels: o estado anterior será refeito a partir das operações.
+        """
+        self.adicionar(None)
+
+    def adicionar(self, passo):
+        self.passos.append(passo)
+        if passo is not None:
+            self.bytes_usados += passo[1].nbytes
+        # Descarta os passos mais antigos até caber no orçamento (referências não ocupam memória).
+        while self.bytes_usados > self.orcamento_bytes:
+            antigo = self.passos.popleft()
+            if antigo is not None:
+                self.bytes_usados -= antigo[1].nbytes
+
+    def retirar(self):
+        """
+        Remove e retorna o passo mais recente.
+        """
+        passo = self.passos.pop()
+        if passo is not None:
+            self.bytes_usados -= passo[1].nbytes
+        return passo
+
+    def limpar(self):
+        self.passos.clear()
+        self.bytes_usados = 0
+
+class SessaoEditor:
+    """
+    Estado de edição de uma imagem, sem interface: a imagem original, a imagem editada, o histórico
+    para desfazer e as operações a refazer na resolução cheia. Com 'tamanho_proxy' (largura, altura),
+    a edição é feita em uma cópia reduzida que cabe nesse tamanho, e só a imagem final é processada
+    na resolução cheia. Cada sessão tem o seu cache de resultados.
+    A edição em resolução cheia pode ser montada em outra thread (estado_atual e montar_resolucao_cheia);
+    as demais operações são feitas pela thread que edita.
+    """
+    def __init__(self, adesivos, tamanho_proxy=None, executor=None, cache=None,
+                 orcamento_historico=ORCAMENTO_HISTORICO_BYTES):
+        self.adesivos = adesivos            # Adesivos compilados, indexados como na área de adesivos.
+        self.tamanho_proxy = tamanho_proxy
+        self.executor = executor if executor is not None else executor_faixas
+        self.cache = cache if cache is not None else CacheResultados()
+        self.imagem_original = None         # Imagem carregada, em resolução cheia.
+        self.imagem_proxy = None            # Cópia reduzida da imagem original, editada durante a interação.
+        self.escala_proxy = 1.0             # Escala da imagem proxy em relação à imagem original.
+        self.imagem_com_efeitos = None      # Imagem editada (proxy), com filtros e adesivos aplicados.
+        self.imagem_cheia = None            # A mesma edição em resolução cheia, montada só quando pedida.
+        self.edicao = 0                     # Aumenta a cada mudança da imagem editada.
+        self.edicao_cheia = -1              # Edição à qual a imagem em resolução cheia corresponde.
+        self.trava_cheia = threading.Lock() # Protege a troca da imagem em resolução cheia entre threads.
+        self.historico = HistoricoDeEdicao(orcamento_historico)  # Passos para desfazer.
+        self.operacoes = []                 # Operações aplicadas (filtros e adesivos), refeitas ao salvar.
+        self.versao = 0                     # Aumenta a cada imagem carregada; identifica os resultados no cache.
+
+    def carregar(self, imagem):
+        """
+        Começa a editar uma nova imagem; os resultados guardados da imagem anterior não servem mais.
+        """
+        self.versao += 1
+        self.cache.limpar()
+        self.imagem_original = imagem
+        self.imagem_proxy, self.escala_proxy = preparar_proxy(imagem, self.tamanho_proxy)
+        self.operacoes = []
+        self.imagem_com_efeitos = self.imagem_proxy.copy()
+        self.historico.limpar()
+        self.marcar_alteracao()
+
+    def marcar_alteracao(self):
+        """
+        Registra que a imagem editada mudou: a imagem em resolução cheia já montada deixa de valer.
+        """
+        with self.trava_cheia:
+            self.edicao += 1
+
+    def filtrar(self, indices, imagem, escala, versao=None):
+        """
+        Aplica a cadeia de filtros dada à imagem (a original reduzida pelo fator 'escala'), em faixas
+        paralelas se ela for grande. Um resultado já visto vem do cache, somente leitura.
+        'versao' é a da imagem recebida (por padrão, a da imagem carregada agora).
+        """
+        return self.cache.obter(
+            (self.versao if versao is None else versao, indices, escala),
+            lambda: self.executor.aplicar(montar_cadeia(indices).na_escala(escala), imagem))
+
+    def adesivo_na_escala(self, indice, escala):
+        """
+        Adesivo de índice dado, com o tamanho relativo à imagem original, para uma imagem
+        reduzida pelo fator 'escala' em relação a ela.
+        """
+        adesivo = self.adesivos[indice]
+        return adesivo.na_escala(adesivo.escala_relativa(*self.imagem_original.shape[:2]) * escala)
+
+    def aplicar_filtros(self, indices):
+        """
+        Aplica à imagem editada a cadeia de filtros dada (índices do registro). Um filtro sempre parte
+        da imagem original (os adesivos colados antes são descartados), e um resultado já visto vem do cache.
+        """
+        indices = tuple(indices)
+        # O filtro muda a imagem inteira: o histórico guarda só a referência, sem pixels.
+        self.historico.guardar_referencia()
+        # A cópia recebe os adesivos seguintes.
+        self.imagem_com_efeitos = self.filtrar(indices, self.imagem_proxy, self.escala_proxy).copy()
+        self.operacoes.append(("filtro", indices))
+        self.marcar_alteracao()
+        return self.imagem_com_efeitos
+
+    def colar_adesivo(self, indice, x, y):
+        """
+        Cola o adesivo de índice dado em (x, y) da imagem original (em pixels da resolução cheia),
+        com o tamanho relativo a ela. Na imagem proxy, a posição é reduzida na mesma proporção.
+        """
+        adesivo = self.adesivo_na_escala(indice, self.escala_proxy)
+        x_proxy, y_proxy = self.para_proxy(x, y)
+        imagem = self.imagem_com_efeitos
+        if isinstance(imagem, np.ndarray) and imagem.ndim == 3:
+            # Só os pixels do retângulo que o adesivo vai alterar são guardados para desfazer.
+            self.historico.guardar_retalho(
+                imagem, regiao_adesivo(imagem.shape, adesivo, x_proxy, y_proxy) or (0, 0, 0, 0))
+        else:
+            # A imagem ainda está em forma compacta e vai virar BGR: desfazer volta a ela pelas operações.
+            self.historico.guardar_referencia()
+        # O adesivo é colorido: uma imagem em forma compacta precisa virar BGR antes.
+        self.imagem_com_efeitos = expandir_para_bgr(imagem)
+        compor_adesivo(self.imagem_com_efeitos, adesivo, x_proxy, y_proxy)
+        # Registra a posição na imagem original, para refazer o adesivo na resolução cheia.
+        self.operacoes.append(("adesivo", indice, x, y))
+        with self.trava_cheia:
+            atualizada = self.edicao_cheia == self.edicao
+            self.edicao += 1
+            if atualizada and self.escala_proxy < 1.0:
+                # A edição em resolução cheia já montada recebe o mesmo adesivo, na posição exata,
+                # e continua valendo (sem ser montada de novo).
+                self.imagem_cheia = expandir_para_bgr(self.imagem_cheia)
+                compor_adesivo(self.imagem_cheia, self.adesivo_na_escala(indice, 1.0), x, y)
+                self.edicao_cheia = self.edicao
+        return self.imagem_com_efeitos
+
+    def regiao_do_adesivo(self, indice, x, y):
+        """
+        Retângulo (topo, base, esquerda, direita) da imagem original que o adesivo colado em (x, y)
+        altera, ou None se ele fica inteiro fora.
+        """
+        return regiao_adesivo(self.imagem_original.shape, self.adesivo_na_escala(indice, 1.0), x, y)
+
+    def para_proxy(self, x, y):
+        """
+        Posição na imagem proxy correspondente a (x, y) da imagem original.
+        """
+        return int(x * self.escala_proxy), int(y * self.escala_proxy)
+
+    def desfazer(self):
+        """
+        Volta ao estado anterior à última operação. Retorna False se não havia nada a desfazer
+        (ou se os passos anteriores já saíram do histórico por falta de memória).
+        """
+        if not self.historico:
+            return False
+        passo = self.historico.retirar()
+        self.operacoes.pop()
+        self.marcar_alteracao()
+        if passo is None:
+            # Filtro (ou adesivo sobre uma imagem compacta): refaz o estado anterior pelas operações.
+            self.imagem_com_efeitos = self.refazer_operacoes(self.imagem_proxy, self.escala_proxy)
+        else:
+            # Adesivo: devolve os pixels anteriores do retângulo alterado, na própria imagem.
+            (topo, base, esquerda, direita), retalho = passo
+            self.imagem_com_efeitos[topo:base, esquerda:direita] = retalho
+        return True
+
+    def refazer_operacoes(self, imagem_base, escala, operacoes=None, versao=None):
+        """
+        Refaz as operações registradas (ou as dadas) sobre 'imagem_base' (a imagem original reduzida
+        pelo fator 'escala'). Um filtro sempre parte da imagem original, então tudo antes do último
+        filtro é descartado.
+        """
+        if operacoes is None:
+            operacoes = self.operacoes
+        inicio = 0
+        for i, operacao in enumerate(operacoes):
+            if operacao[0] == "filtro":
+                inicio = i
+        imagem = imagem_base.copy()
+        for operacao in operacoes[inicio:]:
+            if operacao[0] == "filtro":
+                # Mesma cadeia do clique, na qualidade exata e em faixas paralelas (ou já guardada no cache).
+                imagem = self.filtrar(operacao[1], imagem_base, escala, versao).copy()
+            else:
+                _, indice_adesivo, x, y = operacao
+                if escala != 1.0:
+                    # A posição foi registrada na imagem original.
+                    x, y = self.para_proxy(x, y)
+                imagem = expandir_para_bgr(imagem)  # O adesivo é colorido.
+                compor_adesivo(imagem, self.adesivo_na_escala(indice_adesivo, escala), x, y)
+        return imagem
+
+    def estado_atual(self):
+        """
+        Retrato do estado da edição, para montar a resolução cheia em outra thread sem depender
+        das operações feitas depois: (edição, versão, imagem original, operações).
+        """
+        return self.edicao, self.versao, self.imagem_original, tuple(self.operacoes)
+
+    def resolucao_cheia_pronta(self):
+        """
+        Retorna a edição em resolução cheia se ela já estiver montada para o estado atual, senão None.
+        """
+        if self.escala_proxy == 1.0:
+            return self.imagem_com_efeitos  # A edição já é feita na resolução cheia.
+        with self.trava_cheia:
+            return self.imagem_cheia if self.edicao_cheia == self.edicao else None
+
+    def montar_resolucao_cheia(self, estado):
+        """
+        Refaz na imagem original, em resolução cheia, as operações de um estado (ver estado_atual).
+        Pode ser chamada de outra thread: o resultado só é guardado se a edição não mudou enquanto isso.
+        Retorna a imagem montada, ou None se ela já não corresponde ao estado atual.
+        """
+        edicao, versao, imagem_original, operacoes = estado
+        imagem = self.refazer_operacoes(imagem_original, 1.0, operacoes, versao)
+        with self.trava_cheia:
+            if edicao != self.edicao:
+                return None
+            self.imagem_cheia, self.edicao_cheia = imagem, edicao
+        return imagem
+
+    def renderizar_resolucao_cheia(self):
+        """
+        Refaz na imagem original, em resolução cheia, as operações feitas sobre a imagem proxy.
+        O resultado fica guardado (e recebe os adesivos seguintes) até um filtro ou desfazer mudá-lo.
+        """
+        imagem = self.resolucao_cheia_pronta()
+        if imagem is None:
+            imagem = self.montar_resolucao_cheia(self.estado_atual())
+        return imagem